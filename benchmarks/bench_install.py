@@ -0,0 +1,320 @@
+"""Install benchmark.
+
+Generate local git repositories and a local package index, and
+time ``pak install`` for a requirements file which uses them.
+No network access is needed:
+
+* git packages use ``https://<token>@github.com/outpak-bench/...``
+  urls, which git rewrites to ``file://`` repositories (using
+  ``url.<base>.insteadOf`` from ``GIT_CONFIG_*`` variables);
+* pip packages are found in a simple index (PEP 503) saved in a
+  local directory and used with ``PIP_INDEX_URL``.
+
+Packages are built by the in-tree backend in ``wheel_backend.py``.
+Each run installs in a new virtualenv:
+
+* cold: empty clone_dir and pip cache;
+* warm: clone_dir and pip cache from the cold run;
+* noop: same virtualenv of the warm run (stamp found).
+
+Results, with time spent in each phase (see ``--trace``), are
+saved as JSON.
+
+Usage:
+    python benchmarks/bench_install.py [git_packages] [pip_packages]
+        [--jobs=<n>] [--batch] [--mirror] [--wheel-cache] [--prefetch]
+        [--repeat=<n>] [--output=<path>]
+"""
+import datetime
+import json
+import os
+import platform
+import shutil
+import site
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from wheel_backend import write_wheel  # noqa: E402
+
+GIT_BASE = "https://token@github.com/outpak-bench/"
+
+PAK = """
+version: "1"
+github_key: OUTPAK_BENCH_TOKEN
+env_key: OUTPAK_BENCH_ENV
+envs:
+  bench:
+    key_value: bench
+    clone_dir: {clone_dir}
+    jobs: {jobs}
+    batch: {batch}
+    use_mirror: {use_mirror}
+    use_wheel_cache: {use_wheel_cache}
+    prefetch: {prefetch}
+    files:
+      - requirements.txt
+"""
+
+PYPROJECT = """[build-system]
+requires = []
+build-backend = "wheel_backend"
+backend-path = ["."]
+"""
+
+BENCH_CFG = """[metadata]
+name = {name}
+version = {version}
+"""
+
+
+def _git(args, cwd):
+    subprocess.check_call(
+        ["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost",
+         "-c", "init.defaultBranch=master"] + args,
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def create_repository(path, name):
+    """Create git repository with a package built by wheel_backend."""
+    os.makedirs(os.path.join(path, name))
+    for filename, content in [
+            ("pyproject.toml", PYPROJECT),
+            ("bench.cfg", BENCH_CFG.format(name=name, version="1.0")),
+            (os.path.join(name, "__init__.py"), "VERSION = '1.0'\n")]:
+        with open(os.path.join(path, filename), "w") as file:
+            file.write(content)
+    shutil.copy(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     "wheel_backend.py"),
+        path)
+    _git(["init", "-q"], path)
+    _git(["add", "."], path)
+    _git(["commit", "-q", "-m", "Initial commit"], path)
+    _git(["tag", "v1.0"], path)
+
+
+def create_index(path, names):
+    """Create simple index (PEP 503) with one wheel for each name.
+
+    Each wheel depends on the next one, in groups of four, so
+    pip needs to resolve some dependencies.
+    """
+    files_dir = os.path.join(path, "files")
+    os.makedirs(files_dir)
+    links = []
+    for index, name in enumerate(names):
+        requires = []
+        if index % 4 != 3 and index + 1 < len(names):
+            requires.append(names[index + 1])
+        filename = write_wheel(
+            files_dir, name, "1.0",
+            {"{}/__init__.py".format(name): "VERSION = '1.0'\n"},
+            requires)
+        project_dir = os.path.join(path, "simple", name)
+        os.makedirs(project_dir)
+        with open(os.path.join(project_dir, "index.html"), "w") as file:
+            file.write(
+                '<a href="../../files/{0}">{0}</a>\n'.format(filename))
+        links.append('<a href="{0}/">{0}</a>'.format(name))
+    with open(os.path.join(path, "simple", "index.html"), "w") as file:
+        file.write("\n".join(links) + "\n")
+
+
+def create_project(path, git_packages, pip_packages, options):
+    """Create repositories, index, requirements and pak.yml.
+
+    Half of git packages are editable. Git packages are listed in
+    a file included by ``requirements.txt``.
+    """
+    git_lines = []
+    for index in range(git_packages):
+        name = "benchpkg{}".format(index)
+        create_repository(os.path.join(path, "repos", name), name)
+        line = "git+{}{}@{}#egg={}".format(
+            GIT_BASE.replace("token@", ""), name,
+            "v1.0" if index % 2 else "master", name)
+        git_lines.append("-e " + line if index % 2 else line)
+    pip_names = ["benchwheel{}".format(index) for index in range(pip_packages)]
+    create_index(os.path.join(path, "index"), pip_names)
+    with open(os.path.join(path, "requirements.txt"), "w") as file:
+        file.write("".join("{}==1.0\n".format(name) for name in pip_names))
+        file.write("-r requirements_git.txt\n")
+    with open(os.path.join(path, "requirements_git.txt"), "w") as file:
+        file.write("".join(line + "\n" for line in git_lines))
+    with open(os.path.join(path, "pak.yml"), "w") as file:
+        file.write(PAK.format(
+            clone_dir=os.path.join(path, "src"),
+            jobs=options['jobs'],
+            batch=str(options['batch']).lower(),
+            use_mirror=str(options['use_mirror']).lower(),
+            use_wheel_cache=str(options['use_wheel_cache']).lower(),
+            prefetch=str(options['prefetch']).lower()
+        ))
+
+
+def create_virtualenv(path):
+    """Create virtualenv which can import outpak from this tree.
+
+    Outpak and its requirements are added with a ``.pth`` file, so
+    packages installed in virtualenv are found first.
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    subprocess.check_call([sys.executable, "-m", "venv", path])
+    python = os.path.join(path, "bin", "python")
+    site_dir = subprocess.check_output([
+        python, "-c", "import sysconfig; print(sysconfig.get_path('purelib'))"
+    ], universal_newlines=True).strip()
+    with open(os.path.join(site_dir, "outpak-bench.pth"), "w") as file:
+        file.write("\n".join([ROOT] + site.getsitepackages()) + "\n")
+    return python
+
+
+def get_environment(path, venv_path):
+    """Return environment variables for hermetic install."""
+    env = dict(
+        os.environ,
+        OUTPAK_FILE=os.path.join(path, "pak.yml"),
+        OUTPAK_BENCH_ENV="bench",
+        OUTPAK_BENCH_TOKEN="token",
+        VIRTUAL_ENV=venv_path,
+        PATH=os.pathsep.join(
+            [os.path.join(venv_path, "bin"), os.environ.get("PATH", "")]),
+        GIT_CONFIG_NOSYSTEM="1",
+        GIT_CONFIG_GLOBAL=os.devnull,
+        GIT_TERMINAL_PROMPT="0",
+        GIT_CONFIG_COUNT="2",
+        GIT_CONFIG_KEY_0="url.file://{}/.insteadOf".format(
+            os.path.join(path, "repos")),
+        GIT_CONFIG_VALUE_0=GIT_BASE,
+        GIT_CONFIG_KEY_1="uploadpack.allowFilter",
+        GIT_CONFIG_VALUE_1="true",
+        PIP_INDEX_URL="file://{}/".format(
+            os.path.join(path, "index", "simple")),
+        PIP_CACHE_DIR=os.path.join(path, "pip-cache"),
+        PIP_DISABLE_PIP_VERSION_CHECK="1",
+        PIP_NO_INPUT="1"
+    )
+    env.pop("PYTHONPATH", None)
+    return env
+
+
+def get_phases(trace_path):
+    """Return total seconds for each phase in trace file."""
+    if not os.path.exists(trace_path):
+        return {}
+    with open(trace_path) as file:
+        events = json.load(file)['traceEvents']
+    phases = {}
+    for event in events:
+        phases[event['cat']] = phases.get(event['cat'], 0) + \
+            event['dur'] / 1000000
+    return {key: round(value, 3) for key, value in sorted(phases.items())}
+
+
+def run_install(path, python, venv_path):
+    """Run ``pak install`` and return seconds and time for each phase."""
+    trace_path = os.path.join(path, "trace.json")
+    if os.path.exists(trace_path):
+        os.remove(trace_path)
+    start = time.perf_counter()
+    process = subprocess.run(
+        [python, "-m", "outpak.run", "install",
+         "--trace={}".format(trace_path)],
+        cwd=path, env=get_environment(path, venv_path),
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+    duration = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(process.stdout[-4000:])
+    return {
+        'seconds': round(duration, 3),
+        'phases': get_phases(trace_path)
+    }
+
+
+def bench(path, repeat):
+    """Run cold, warm and noop installs and keep the best of each."""
+    venv_path = os.path.join(path, "venv")
+    results = {}
+
+    def keep(name, result):
+        if name not in results or \
+                result['seconds'] < results[name]['seconds']:
+            results[name] = result
+
+    for _ in range(repeat):
+        for name in ["src", "pip-cache"]:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        python = create_virtualenv(venv_path)
+        keep("cold", run_install(path, python, venv_path))
+        python = create_virtualenv(venv_path)
+        keep("warm", run_install(path, python, venv_path))
+        keep("noop", run_install(path, python, venv_path))
+    return results
+
+
+def get_commit():
+    """Return current commit for this tree, if any."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT,
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Run benchmark."""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = dict(
+        arg[2:].split("=", 1) if "=" in arg else (arg[2:], True)
+        for arg in sys.argv[1:] if arg.startswith("--")
+    )
+    git_packages = int(args[0]) if args else 10
+    pip_packages = int(args[1]) if len(args) > 1 else 30
+    repeat = int(flags.get("repeat", 1))
+    output = flags.get("output", "bench_install.json")
+    options = {
+        'jobs': int(flags.get("jobs", 1)),
+        'batch': "batch" in flags,
+        'use_mirror': "mirror" in flags,
+        'use_wheel_cache': "wheel-cache" in flags,
+        'prefetch': "prefetch" in flags
+    }
+
+    path = tempfile.mkdtemp(prefix="outpak-bench-")
+    try:
+        create_project(path, git_packages, pip_packages, options)
+        results = bench(path, repeat)
+    finally:
+        shutil.rmtree(path)
+
+    for name in ["cold", "warm", "noop"]:
+        print("{:<6}{:8.3f}s  {}".format(
+            name, results[name]['seconds'],
+            "  ".join("{} {:.3f}s".format(phase, value)
+                      for phase, value in results[name]['phases'].items())))
+    data = {
+        'commit': get_commit(),
+        'date': datetime.datetime.utcnow().isoformat() + "Z",
+        'python': platform.python_version(),
+        'git_packages': git_packages,
+        'pip_packages': pip_packages,
+        'repeat': repeat,
+        'options': options,
+        'results': results
+    }
+    with open(output, "w") as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+    print("Results saved in {}".format(output))
+
+
+if __name__ == "__main__":
+    main()
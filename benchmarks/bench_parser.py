@@ -0,0 +1,98 @@
+"""Requirements parser benchmark.
+
+Generate a requirements file with a mix of pinned, extras,
+marker, path, vcs and url lines and time how long the parser
+takes to read it, with and without the disk cache.
+
+Usage:
+    python benchmarks/bench_parser.py [lines] [repeat]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from outpak import parser  # noqa: E402
+from outpak.parser import iter_lines, parse_line  # noqa: E402
+
+TEMPLATES = [
+    "package{0}==1.{0}.0",
+    "package{0} >=1.2,<2.0",
+    "package{0}[security,socks]>=2.18.1",
+    "package{0}[foo, bar]",
+    "package{0}",
+    "package{0} ==5.4 ; python_version < '3.6'",
+    "# comment for package{0}",
+    "",
+    "./packages/package{0}",
+    "-e git+https://github.com/group/package{0}.git@v{0}#egg=package{0}",
+    "-e git+git@github.com:group/package{0}@master#egg=package{0}",
+    "git+ssh://git.example.org/package{0}@1234abcd#egg=package{0}",
+    "hg+http://hg.example.org/package{0}#egg=package{0}",
+    "https://example.org/package{0}@1234abcd#egg=package{0}",
+    "package{0}==1.0  # pinned",
+    "package{0}>=1.0 \\\n    --hash=sha256:abcdef",
+]
+
+
+def generate(path, size):
+    """Write requirements file with ``size`` lines."""
+    with open(path, "w") as file:
+        for index in range(size):
+            template = TEMPLATES[index % len(TEMPLATES)]
+            file.write(template.format(index) + "\n")
+
+
+def parse(path):
+    """Parse requirements file and return number of packages."""
+    with open(path) as file:
+        return len([parse_line(line) for line in iter_lines(file)])
+
+
+def parse_cached(path, cache_dir):
+    """Parse requirements file using disk cache."""
+    parser._file_cache.clear()
+    return len(parser.parse_file(path, cache_dir))
+
+
+def best(function, repeat, *args):
+    """Return best time for function."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    """Run benchmark."""
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    handle, path = tempfile.mkstemp(suffix=".txt")
+    os.close(handle)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        generate(path, size)
+        parse_time, packages = best(parse, repeat, path)
+        cold_time, _ = best(
+            lambda: shutil.rmtree(cache_dir) or parse_cached(path, cache_dir),
+            repeat)
+        warm_time, _ = best(parse_cached, repeat, path, cache_dir)
+    finally:
+        os.remove(path)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print("lines: {}  packages: {}".format(size, packages))
+    for name, value in [
+            ("parse", parse_time),
+            ("cache cold", cold_time),
+            ("cache warm", warm_time)]:
+        print("{:<12}{:.3f}s  {:.0f} lines/s".format(
+            name, value, size / value))
+
+
+if __name__ == "__main__":
+    main()
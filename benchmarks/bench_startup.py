@@ -0,0 +1,150 @@
+"""Startup benchmark.
+
+Measure import time for outpak modules and wall time for
+``pak --version`` and for ``pak install`` with an unchanged
+configuration (stamp found, nothing to do).
+
+With ``--check``, exit with error if modules which must be
+imported only when needed are loaded at startup, or if import
+time for ``outpak.run`` is over the budget (in milliseconds).
+
+Usage:
+    python benchmarks/bench_startup.py [repeat] [--check] [--budget=<ms>]
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Modules which must not be loaded by importing each module
+LAZY_MODULES = {
+    "outpak.run": [
+        "yaml", "buzio", "outpak.main", "packaging", "asyncio",
+        "subprocess"
+    ],
+    "outpak.main": [
+        "yaml", "asyncio", "concurrent.futures", "importlib.metadata",
+        "importlib_metadata", "outpak.pipeline", "outpak.installed"
+    ]
+}
+
+PAK = """
+version: "1"
+github_key: OUTPAK_BENCH_TOKEN
+env_key: OUTPAK_BENCH_ENV
+envs:
+  bench:
+    key_value: bench
+    clone_dir: {clone_dir}
+    files:
+      - requirements.txt
+"""
+
+
+def _run(argv, env=None):
+    start = time.perf_counter()
+    process = subprocess.run(
+        argv, cwd=ROOT, env=env, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, universal_newlines=True)
+    return time.perf_counter() - start, process
+
+
+def get_import_time(module):
+    """Return cumulative import time for module, in milliseconds."""
+    _, process = _run([sys.executable, "-X", "importtime", "-c",
+                       "import {}".format(module)])
+    for line in process.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$", line)
+        if m and m.group(2) == module:
+            return int(m.group(1)) / 1000
+    return None
+
+
+def get_loaded_modules(module):
+    """Return lazy modules loaded after importing module."""
+    _, process = _run([
+        sys.executable, "-c",
+        "import sys, {0}; print('\\n'.join(sys.modules))".format(module)
+    ])
+    loaded = set(process.stdout.split())
+    return [name for name in LAZY_MODULES[module] if name in loaded]
+
+
+def best(argv, repeat, env=None):
+    """Return best wall time for command, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        duration, process = _run(argv, env)
+        if process.returncode != 0:
+            raise RuntimeError(process.stdout + process.stderr)
+        timings.append(duration * 1000)
+    return min(timings)
+
+
+def bench_unchanged_install(repeat):
+    """Return best time for ``pak install`` with unchanged config."""
+    from outpak.main import Outpak
+    directory = tempfile.mkdtemp(prefix="outpak-bench-")
+    path = os.path.join(directory, "pak.yml")
+    with open(path, "w") as file:
+        file.write(PAK.format(clone_dir=os.path.join(directory, "src")))
+    with open(os.path.join(directory, "requirements.txt"), "w") as file:
+        file.write("docopt\n")
+    env = dict(
+        os.environ,
+        OUTPAK_BENCH_ENV="bench",
+        OUTPAK_BENCH_TOKEN="token",
+        OUTPAK_FILE=path
+    )
+    argv = [sys.executable, "-m", "outpak.run", "install"]
+    try:
+        # first run checks installed packages and saves the stamp
+        best(argv, 1, env)
+        return best(argv, repeat, env)
+    finally:
+        stamp_path = Outpak(path)._get_stamp_path()
+        if os.path.exists(stamp_path):
+            os.remove(stamp_path)
+        shutil.rmtree(directory)
+
+
+def main():
+    """Run benchmark."""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    repeat = int(args[0]) if args else 10
+    check = "--check" in sys.argv
+    budget = None
+    for arg in sys.argv[1:]:
+        if arg.startswith("--budget="):
+            budget = float(arg.split("=", 1)[1])
+    sys.path.insert(0, ROOT)
+
+    errors = []
+    for module in sorted(LAZY_MODULES):
+        import_time = get_import_time(module)
+        loaded = get_loaded_modules(module)
+        print("import {:<14}{:8.1f}ms".format(module, import_time))
+        if loaded:
+            errors.append("{} loads {}".format(module, ", ".join(loaded)))
+        if module == "outpak.run" and budget and import_time > budget:
+            errors.append("{} import takes {:.1f}ms (budget {:.1f}ms)".format(
+                module, import_time, budget))
+
+    print("pak --version       {:8.1f}ms".format(best(
+        [sys.executable, "-m", "outpak.run", "--version"], repeat)))
+    print("pak install (noop)  {:8.1f}ms".format(
+        bench_unchanged_install(repeat)))
+
+    for error in errors:
+        print("ERROR: {}".format(error))
+    if check and errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
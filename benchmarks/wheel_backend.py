@@ -0,0 +1,97 @@
+"""Minimal PEP 517 build backend for benchmark packages.
+
+Packages generated by ``bench_install.py`` use this module as an
+in-tree backend, so pip can build them without download setuptools.
+The same code writes the wheels for the local package index.
+
+Package name, version and dependencies are read from ``bench.cfg``::
+
+    [metadata]
+    name = benchpkg0
+    version = 1.0
+    requires = benchwheel1 benchwheel2
+"""
+import base64
+import configparser
+import hashlib
+import os
+import zipfile
+
+
+def _get_record_line(path, data):
+    digest = base64.urlsafe_b64encode(
+        hashlib.sha256(data).digest()).rstrip(b"=").decode("ascii")
+    return "{},sha256={},{}".format(path, digest, len(data))
+
+
+def write_wheel(wheel_directory, name, version, files, requires=None):
+    """Write a pure Python wheel.
+
+    Args:
+        wheel_directory (string): directory for wheel file
+        name (string): distribution name
+        version (string): distribution version
+        files (dict): content for each path inside wheel
+        requires (list, optional): names for Requires-Dist
+
+    Returns
+    -------
+        String: wheel file name
+
+    """
+    dist_info = "{}-{}.dist-info".format(name, version)
+    metadata = "Metadata-Version: 2.1\nName: {}\nVersion: {}\n".format(
+        name, version)
+    for requirement in requires or []:
+        metadata += "Requires-Dist: {}\n".format(requirement)
+    files = dict(files)
+    files[dist_info + "/METADATA"] = metadata
+    files[dist_info + "/WHEEL"] = (
+        "Wheel-Version: 1.0\nGenerator: outpak-bench\n"
+        "Root-Is-Purelib: true\nTag: py3-none-any\n"
+    )
+    filename = "{}-{}-py3-none-any.whl".format(name, version)
+    record = []
+    with zipfile.ZipFile(
+            os.path.join(wheel_directory, filename), "w") as archive:
+        for path in sorted(files):
+            data = files[path].encode("utf-8")
+            archive.writestr(path, data)
+            record.append(_get_record_line(path, data))
+        record.append(dist_info + "/RECORD,,")
+        archive.writestr(dist_info + "/RECORD", "\n".join(record) + "\n")
+    return filename
+
+
+def _read_config():
+    config = configparser.ConfigParser()
+    config.read("bench.cfg")
+    metadata = config["metadata"]
+    return (
+        metadata["name"],
+        metadata["version"],
+        metadata.get("requires", "").split()
+    )
+
+
+def build_wheel(
+        wheel_directory, config_settings=None, metadata_directory=None):
+    """Build wheel with package module (PEP 517 hook)."""
+    name, version, requires = _read_config()
+    path = os.path.join(name, "__init__.py")
+    with open(path) as file:
+        files = {"{}/__init__.py".format(name): file.read()}
+    return write_wheel(wheel_directory, name, version, files, requires)
+
+
+def build_editable(
+        wheel_directory, config_settings=None, metadata_directory=None):
+    """Build wheel which points to source directory (PEP 660 hook)."""
+    name, version, requires = _read_config()
+    files = {"{}.pth".format(name): os.getcwd() + "\n"}
+    return write_wheel(wheel_directory, name, version, files, requires)
+
+
+def build_sdist(sdist_directory, config_settings=None):
+    """Refuse to build source distributions (PEP 517 hook)."""
+    raise NotImplementedError("benchmark packages have no sdist")
@@ -0,0 +1,146 @@
+"""Source archive module.
+
+Download the source tree for one commit as a tarball, without
+git, and extract it.
+"""
+import os
+import shutil
+
+# Default url templates for each host. Placeholders are: host,
+# owner, repo, path (owner/repo) and ref.
+ARCHIVE_URLS = {
+    "github.com":
+        "https://api.github.com/repos/{owner}/{repo}/tarball/{ref}",
+    "bitbucket.org":
+        "https://bitbucket.org/{owner}/{repo}/get/{ref}.tar.gz",
+}
+
+CHUNK_SIZE = 64 * 1024
+
+# File with commit for extracted sources
+COMMIT_FILE = ".outpak-commit"
+
+
+class ArchiveError(Exception):
+    """Archive cannot be downloaded or extracted."""
+
+
+def get_archive_url(url, ref, template=None):
+    """Return archive url for repository and ref.
+
+    Args:
+        url (string): repository url, without protocol
+            (ex.: github.com/my_group/my_pack)
+        ref (string): commit, branch or tag
+        template (string, optional): url template, instead of
+            default template for host
+
+    Returns
+    -------
+        String: archive url or None if host is unknown
+
+    """
+    host, _, path = url.partition("/")
+    template = template or ARCHIVE_URLS.get(host)
+    if not template or path.count("/") != 1:
+        return None
+    owner, repo = path.split("/")
+    return template.format(
+        host=host, owner=owner, repo=repo, path=path, ref=ref)
+
+
+def download(url, path, headers=None, timeout=60):
+    """Stream url content to file.
+
+    Headers are not sent again if server redirects to another url,
+    so credentials are not sent to other hosts.
+
+    Args:
+        url (string): archive url
+        path (string): full path for file
+        headers (dict, optional): request headers
+        timeout (int, optional): socket timeout in seconds
+
+    Raises
+    ------
+        ArchiveError: if download fails
+
+    """
+    from urllib.error import URLError
+    from urllib.request import Request, urlopen
+    request = Request(url)
+    for key, value in (headers or {}).items():
+        request.add_unredirected_header(key, value)
+    try:
+        with urlopen(request, timeout=timeout) as response, \
+                open(path, "wb") as file:
+            shutil.copyfileobj(response, file, CHUNK_SIZE)
+    except (URLError, OSError, ValueError) as exc:
+        raise ArchiveError("Cannot download {}: {}".format(url, exc))
+
+
+def _strip_member(member, destination):
+    """Remove top folder from member name and check its paths.
+
+    Returns
+    -------
+        TarInfo: member with new name or None for top folder
+
+    """
+    parts = member.name.split("/", 1)
+    if len(parts) < 2 or not parts[1]:
+        return None
+    member.name = parts[1]
+    targets = [member.name]
+    if member.issym():
+        targets.append(os.path.join(os.path.dirname(member.name),
+                                    member.linkname))
+    elif member.islnk():
+        member.linkname = member.linkname.split("/", 1)[-1]
+        targets.append(member.linkname)
+    root = os.path.realpath(destination)
+    for target in targets:
+        full_path = os.path.realpath(os.path.join(root, target))
+        if os.path.isabs(target) or \
+                os.path.commonpath([root, full_path]) != root:
+            raise ArchiveError("Unsafe path in archive: {}".format(target))
+    if not (member.isfile() or member.isdir() or member.issym() or
+            member.islnk()):
+        return None
+    return member
+
+
+def extract(path, destination):
+    """Extract tarball in destination, without its top folder.
+
+    Archives from GitHub and Bitbucket have all files inside a
+    single folder named after repository and commit.
+
+    Args:
+        path (string): full path for tarball
+        destination (string): folder for extracted files
+
+    Raises
+    ------
+        ArchiveError: if archive is invalid or has unsafe paths
+
+    """
+    import tarfile
+    try:
+        with tarfile.open(path) as archive:
+            members = [
+                member
+                for member in (
+                    _strip_member(member, destination)
+                    for member in archive.getmembers()
+                )
+                if member
+            ]
+            if not members:
+                raise ArchiveError("Archive is empty: {}".format(path))
+            kwargs = {}
+            if hasattr(tarfile, "data_filter"):
+                kwargs['filter'] = "data"
+            archive.extractall(destination, members=members, **kwargs)
+    except (tarfile.TarError, OSError, EOFError) as exc:
+        raise ArchiveError("Cannot extract {}: {}".format(path, exc))
@@ -0,0 +1,88 @@
+"""Command execution module."""
+import time
+from collections import deque, namedtuple
+
+
+CommandResult = namedtuple(
+    "CommandResult",
+    ["returncode", "duration", "output", "stdout"]
+)
+
+
+def format_command(argv, cwd=None):
+    """Return command as a readable string.
+
+    Args:
+        argv (list): command and arguments
+        cwd (string, optional): working directory
+
+    Returns
+    -------
+        String: command line
+
+    """
+    command = " ".join(argv)
+    return "cd {} && {}".format(cwd, command) if cwd else command
+
+
+def run_command(argv, cwd=None, env=None, capture=False, callback=None,
+                tail=50):
+    """Run command without shell.
+
+    Output is read line by line, and only the last ``tail``
+    lines are kept in result. If ``capture`` is set, stdout is
+    kept in result and only stderr is streamed.
+
+    Args:
+        argv (list): command and arguments
+        cwd (string, optional): working directory
+        env (dict, optional): environment variables for command
+        capture (bool, optional): keep stdout in result
+        callback (callable, optional): called for each output line
+        tail (int, optional): number of output lines kept in result
+
+    Returns
+    -------
+        CommandResult: exit code, duration in seconds, output tail
+            and captured stdout
+
+    """
+    import subprocess
+    start = time.time()
+    lines = deque(maxlen=tail)
+    stdout = None
+    try:
+        process = subprocess.Popen(
+            argv,
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE if capture else subprocess.STDOUT
+        )
+    except OSError as exc:
+        return CommandResult(127, time.time() - start, str(exc), None)
+
+    if capture:
+        out, err = process.communicate()
+        stdout = out.decode('utf-8', 'replace')
+        stream = err.decode('utf-8', 'replace').splitlines()
+    else:
+        stream = (
+            line.decode('utf-8', 'replace')
+            for line in iter(process.stdout.readline, b"")
+        )
+    for line in stream:
+        line = line.rstrip("\r\n")
+        lines.append(line)
+        if callback:
+            callback(line)
+    if not capture:
+        process.stdout.close()
+        process.wait()
+
+    return CommandResult(
+        process.returncode,
+        time.time() - start,
+        "\n".join(lines),
+        stdout
+    )
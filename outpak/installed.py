@@ -0,0 +1,126 @@
+"""Installed distributions module."""
+import json
+import os
+import re
+from collections import namedtuple
+from outpak.archive import COMMIT_FILE
+from packaging.utils import canonicalize_name
+
+try:
+    from importlib import metadata
+except ImportError:
+    import importlib_metadata as metadata
+
+
+Distribution = namedtuple(
+    "Distribution",
+    ["name", "version", "requires", "direct_url"]
+)
+
+
+def get_snapshot():
+    """Return installed distributions in current interpreter.
+
+    Returns
+    -------
+        Dict: Distribution data for each normalized name
+
+    """
+    snapshot = {}
+    for dist in metadata.distributions():
+        name = dist.metadata['Name']
+        if not name:
+            continue
+        direct_url = None
+        try:
+            text = dist.read_text('direct_url.json')
+            if text:
+                direct_url = json.loads(text)
+        except (IOError, OSError, ValueError):
+            pass
+        key = canonicalize_name(name)
+        if key not in snapshot:
+            snapshot[key] = Distribution(
+                name=name,
+                version=dist.version,
+                requires=dist.requires or [],
+                direct_url=direct_url
+            )
+    return snapshot
+
+
+def get_installed_commit(distribution, wheel_root=None):
+    """Return commit for distribution installed from git.
+
+    Check, in order:
+
+    1. The ``vcs_info`` in direct_url.json (ex.: pip install git+https://...)
+    2. The HEAD of local git repository (ex.: pip install -e /path/to/repo)
+       or the commit saved with sources downloaded as archive
+    3. The commit in wheel path, for wheels installed from Outpak cache
+
+    Args:
+        distribution (Distribution): installed distribution data
+        wheel_root (string, optional): path for Outpak wheel cache
+
+    Returns
+    -------
+        String: commit or None if not found
+
+    """
+    direct_url = distribution.direct_url or {}
+    vcs_info = direct_url.get('vcs_info')
+    if vcs_info:
+        return vcs_info.get('commit_id')
+
+    url = direct_url.get('url', "")
+    if not url.startswith("file://"):
+        return None
+    path = url[len("file://"):]
+
+    if 'dir_info' in direct_url:
+        commit_path = os.path.join(path, COMMIT_FILE)
+        if os.path.isfile(commit_path):
+            with open(commit_path) as file:
+                return file.read().strip() or None
+        head_file = os.path.join(path, ".git", "HEAD")
+        if os.path.isfile(os.path.join(path, ".git")):
+            # git worktree
+            with open(os.path.join(path, ".git")) as file:
+                gitdir = file.read().split("gitdir:")[-1].strip()
+            head_file = os.path.join(gitdir, "HEAD")
+        return _read_head(head_file)
+
+    if 'archive_info' in direct_url and wheel_root and \
+            path.startswith(wheel_root):
+        m = re.search(r"/([0-9a-f]{40})/", path[len(wheel_root):])
+        if m:
+            return m.group(1)
+    return None
+
+
+def _read_head(head_file):
+    try:
+        with open(head_file) as file:
+            head = file.read().strip()
+    except (IOError, OSError):
+        return None
+    if head.startswith("ref:"):
+        ref = head.split(":", 1)[1].strip()
+        git_dir = os.path.dirname(head_file)
+        commit = _read_head(os.path.join(git_dir, *ref.split("/")))
+        if not commit:
+            commit = _read_packed_ref(git_dir, ref)
+        return commit
+    return head if re.match(r"^[0-9a-f]{40}$", head) else None
+
+
+def _read_packed_ref(git_dir, ref):
+    try:
+        with open(os.path.join(git_dir, "packed-refs")) as file:
+            for line in file:
+                if line.strip().endswith(" {}".format(ref)):
+                    return line.split(" ")[0]
+    except (IOError, OSError):
+        pass
+    return None
@@ -1,11 +1,31 @@
 """Outpak main module."""
+import base64
+import glob
+import hashlib
+import json
 import os
+import platform
 import re
 import shutil
-import subprocess
 import sys
-import yaml
+import sysconfig
+import tempfile
+import time
 from buzio import console
+from outpak import parser
+from outpak.archive import (COMMIT_FILE, ArchiveError, download, extract,
+                            get_archive_url)
+from outpak.command import format_command, run_command
+from outpak.metrics import Metrics
+from outpak.refs import RefResolver
+from outpak.timings import Timings
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+HOOK_EVENTS = ("before_command", "after_command")
+
+BUNDLE_FOLDER = "outpak-bundle"
+BUNDLE_MANIFEST = "manifest.json"
 
 
 class Outpak():
@@ -15,6 +35,11 @@ class Outpak():
     ----------
         data (dict): data from pak.yml
         environment (dict): dictionary data from current environment
+        environment_name (string): name for current environment
+        hooks (dict): callbacks registered for each event
+        metrics (Metrics): metrics for current run
+        resolver (RefResolver): resolver for git heads
+        options (dict): options from command line
         path (string): full path for pak.yml
         token (string): git token from environment variable
 
@@ -25,28 +50,95 @@ class Outpak():
 
         Args:
             path (sring): full path from click option (-c)
+            batch (bool, optional): install pip packages in one transaction
+            jobs (int, optional): number of parallel fetches
+            build_jobs (int, optional): number of parallel wheel builds
+            force (bool, optional): install packages already installed
+            timings (bool, optional): print time spent in each phase
+            trace (string, optional): path for Chrome trace file
+            prefetch (bool, optional): install offline from wheelhouse
+            metrics_file (string, optional): path for OpenMetrics file
+            metrics_json (string, optional): path for JSON metrics
         """
         self.path = path
         self.git_token = ""
         self.bit_token = ""
+        self.options = kwargs
+        self.environment = {}
+        self.environment_name = ""
+        self.resolver = None
+        self.constraint_files = []
+        self.requirement_files = []
+        self.timings = Timings()
+        self.metrics = Metrics()
+        self.hooks = {event: [] for event in HOOK_EVENTS}
+
+    def add_hook(self, event, callback):
+        """Register callback for event.
+
+        Callbacks are called in the order they are registered,
+        from the thread which runs the command (with ``jobs``
+        greater than 1, from many threads at the same time).
+
+        Events:
+            before_command: called with ``(task, cwd, span)``
+                before each subprocess
+            after_command: called with ``(task, cwd, span, result)``
+                after each subprocess, where result is a CommandResult
+
+        Args:
+            event (string): event name
+            callback (callable): function to be called
+
+        Raises
+        ------
+            ValueError: if event is unknown
+
+        """
+        if event not in self.hooks:
+            raise ValueError("Unknown hook event: {}".format(event))
+        self.hooks[event].append(callback)
+
+    def _call_hooks(self, event, *args):
+        for callback in self.hooks[event]:
+            callback(*args)
+
+    def _echo(self, text, output=None, command=False):
+        if output is not None:
+            output.append((text, command))
+        elif command:
+            console.info(text, use_prefix=False)
+        else:
+            print(text)
+
+    def _flush_output(self, output):
+        for text, command in output:
+            self._echo(text, command=command)
 
     def _run_command(
             self,
             task,
+            cwd=None,
             title=None,
             get_stdout=False,
-            run_stdout=False,
             verbose=False,
-            silent=False):
-        """Run command in subprocess.
+            silent=False,
+            output=None,
+            span=None):
+        """Run command in subprocess, without shell.
 
         Args:
-            task (string): command to run
+            task (list): command and arguments
+            cwd (string, optional): working directory
             title (string, optional): title to be printed
             get_stdout (bool, optional): return stdout from command
-            run_stdout (bool, optional): run stdout before command
             verbose (bool, optional): show command in terminal
-            silent (bool, optional): occult stdout/stderr when running command
+            silent (bool, optional): occult stdout/stderr when running
+                command; output tail is still shown if command fails
+            output (list, optional): buffer messages in this list
+                instead of print them
+            span (tuple, optional): phase and package name, to
+                record command duration
 
         Return
         ------
@@ -55,51 +147,77 @@ class Outpak():
         """
         if title:
             console.section(title)
+        if verbose:
+            self._echo(format_command(task, cwd), output, command=True)
 
-        try:
-            if run_stdout:
-                if verbose:
-                    console.info(task, use_prefix=False)
-                command = subprocess.check_output(task, shell=True)
-
-                if not command:
-                    print('An error occur. Task aborted.')
-                    return False
+        streamed = []
 
-                if verbose:
-                    console.info(command, use_prefix=False)
-                ret = subprocess.call(command, shell=True)
+        def callback(line):
+            if not streamed:
+                streamed.append(True)
+            self._echo(line, output)
 
-            elif get_stdout is True:
-                if verbose:
-                    console.info(task, use_prefix=False)
-                ret = subprocess.check_output(task, shell=True)
-            else:
-                if verbose:
-                    console.info(task, use_prefix=False)
-                ret = subprocess.call(
-                    task if not silent else
-                    "{} 2>/dev/null 1>/dev/null".format(task),
-                    shell=True,
-                    stderr=subprocess.STDOUT)
-
-            if ret != 0 and not get_stdout:
-                return False
-        except BaseException:
+        self._call_hooks("before_command", task, cwd, span)
+        start = time.time()
+        result = run_command(
+            task,
+            cwd=cwd,
+            capture=get_stdout,
+            callback=None if silent or get_stdout else callback
+        )
+        if span:
+            self.timings.add(span[0], span[1], start, result.duration)
+        self._call_hooks("after_command", task, cwd, span, result)
+
+        if result.returncode != 0:
+            # Output tail was not shown yet if command was silent,
+            # captured, or could not start (ex.: missing executable)
+            if result.output and not streamed:
+                for line in result.output.splitlines():
+                    self._echo(line, output)
             return False
+        return True if not get_stdout else result.stdout
 
-        try:
-            ret = ret.decode('utf-8')
-        except AttributeError:
-            pass
+    def _run_commands(
+            self,
+            task_list,
+            cwd=None,
+            verbose=False,
+            output=None,
+            span=None):
+        """Run commands in order, until one fails.
+
+        Args:
+            task_list (list): list of commands and arguments
+            cwd (string, optional): working directory
+            verbose (bool, optional): show commands in terminal
+            output (list, optional): buffer messages in this list
+            span (tuple, optional): phase and package name
+
+        Return
+        ------
+            Bool: all tasks succeeded
 
-        return True if not get_stdout else ret
+        """
+        for task in task_list:
+            if not self._run_command(
+                    task, cwd=cwd, verbose=verbose, output=output,
+                    span=span):
+                return False
+        return True
 
     def load_from_yaml(self):
-        """Load data from pak.yml."""
+        """Load data from pak.yml.
+
+        Use the C loader from libyaml, if available.
+        """
+        import yaml
         try:
             with open(self.path, 'r') as file:
-                self.data = yaml.load(file.read())
+                self.data = yaml.load(
+                    file.read(),
+                    Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+                )
         except IOError as exc:
             console.error("Cannot open file: {}".format(exc))
             sys.exit(1)
@@ -189,6 +307,7 @@ class Outpak():
             ]
             if environment_data:
                 self.environment = self.data['envs'][environment_data[0]]
+                self.environment_name = environment_data[0]
                 console.info(
                     "Using configuration for environment: {}".format(
                         environment_data[0]))
@@ -249,6 +368,26 @@ class Outpak():
             )
             sys.exit(1)
 
+    def get_option(self, key, default=None):
+        """Return option value.
+
+        Options informed in command line have precedence
+        over the ones defined in the current environment.
+
+        Args:
+            key (string): option name
+            default (any, optional): value if option is not found
+
+        Returns
+        -------
+            Any: option value
+
+        """
+        value = self.options.get(key)
+        if value is None:
+            value = self.environment.get(key, default)
+        return value
+
     def get_files(self):
         """Return existing files from list.
 
@@ -311,245 +450,1268 @@ class Outpak():
 
         Returns
         -------
-            Dict: data dictionary for package
+            Requirement: data for package
 
             Example 1: django==2.0.1
-            returns {
-                "name": "django",
-                "signal: "=",
-                "version": "2.0.1",
-                "head": None,
-                "egg": None
-            }
+            returns Requirement(
+                name="django",
+                signal="=",
+                version="2.0.1",
+                head=None,
+                egg=None,
+                ...
+            )
 
             Example 2:
             -e git+git@github.com:my_group/my_pack@my_commit#egg=my_package_egg
-            returns {
-                "name": "my_pack",
-                "signal: None,
-                "version": None,
-                "head": "my_commit",
-                "egg": "my_package_egg"
-            }
+            returns Requirement(
+                name="my_pack",
+                signal=None,
+                version=None,
+                head="my_commit",
+                egg="my_package_egg",
+                ...
+            )
 
         """
-        original_line = line
-        line = line.split(" #")[0]  # removing comments (need space)
-        line = line.strip().replace("\n", "").replace(" ", "")
-        data = {
-            "name": None,
-            "signal": None,
-            "version": None,
-            "url": None,
-            "head": None,
-            "egg": None,
-            "line": None,
-            "using_line": False,
-            "option": ""
-        }
-        if line.startswith("-r"):
-            console.warning("Line {} ignored.".format(line))
+        if line.strip().startswith("-r"):
+            console.warning("Line {} ignored.".format(line.strip()))
+            sys.exit(1)
+        try:
+            return parser.parse_line(line)
+        except parser.ParseError as exc:
+            console.error(str(exc))
             sys.exit(1)
-
-        if line.startswith('-'):
-            data['option'] = line[0:2]
-            if data['option'] != "-e":
-                data['line'] = line
-                data['using_line'] = True
-            line = line[2:]
-
-        # SomeProject ==5.4 ; python_version < '2.7'
-        if ";" in line:
-            data['name'] = line.split(";")[0]
-            data['using_line'] = True
-            data['line'] = original_line
-            return data
-
-        # SomeProject0==1.3
-        # SomeProject >=1.2,<.2.0
-        # SomeProject~=1.4.2
-        # SomeProject[foo]>=2.18.1
-        # FooProject>=1.2--global-option="--no-user-cfg"
-        m = re.search(r"(.+)(>|=|~|<)=(\S+)", line)
-        if m:
-            data["name"] = m.group(1)
-            data["signal"] = m.group(2)
-            data["version"] = m.group(3)
-            return data
-
-        # SomeProject[foo, bar]
-        m = re.search(r"(.+\[.+\])", line)
-        if m:
-            data["name"] = m.group(1)
-            return data
-
-        # SomeProject
-        # .packages/my_package
-        if "+" not in line and "//" not in line:
-            data['name'] = line
-            data['line'] = line
-            data['using_line'] = True
-            return data
-
-        # hg+http://hg.myproject.org/MyProject#egg=MyProject
-        # svn+http://svn.myproject.org/svn/MyProject/trunk@2019#egg=MyProject
-        # bzr+lp:MyProject#egg=MyProject
-        if "hg+" in line or "svn+" in line or "bzr+" in line:
-            data['name'] = line
-            data['line'] = line
-            data['using_line'] = True
-            return data
-
-        if line.startswith('git'):
-            # git://git.myproject.org/MyProject#egg=MyProject
-            # git://git.myproject.org/MyProject@1234acbd#egg=MyProject
-            # git+git://git.myproject.org/MyProject#egg=MyProject
-            # git+git://git.myproject.org/MyProject@1234abcd#egg=MyProject
-            m = re.search(r"(git:\/\/)(.+)#", line)
-            if m:
-                data['url'] = m.group(2).replace(".git", "")
-                if "@" in data['url']:
-                    data['head'] = data['url'].split("@")[-1]
-                    data['url'] = data['url'].split("@")[0]
-                data['name'] = data['url'].split("/")[-1]
-                return data
-
-            # git+https://git.myproject.org/MyProject#egg=MyProject
-            # git+https://git.myproject.org/MyProject@1234abcd#egg=MyProject
-            # git+ssh://git.myproject.org/MyProject#egg=MyProject
-            # git+ssh://git.myproject.org/MyProject@1234abcd#egg=MyProject
-            m = re.search(r"(git\+\w+:\/\/)(.+)#", line)
-            if m:
-                data['url'] = m.group(2).replace(".git", "")
-                if "@" in data['url']:
-                    data['head'] = data['url'].split("@")[-1]
-                    data['url'] = data['url'].split("@")[0]
-                data['name'] = data['url'].split("/")[-1]
-                return data
-
-            # git+git@git.myproject.org:MyProject#egg=MyProject
-            # git+git@git.myproject.org:MyProject@1234abcd#egg=MyProject
-            m = re.search(r"(git\+git@)(.+)#", line)
-            if m:
-                data['url'] = m.group(2).replace(".git", "").replace(":", "/")
-                if "@" in data['url']:
-                    data['head'] = data['url'].split("@")[-1]
-                    data['url'] = data['url'].split("@")[0]
-                data['name'] = data['url'].split("/")[-1]
-                return data
-
-        # https://git.myproject.org/MyProject#egg=MyProject
-        # https://git.myproject.org/MyProject@commit1234#egg=MyProject
-        if line.startswith("http"):
-            data['line'] = line.split("#")[0]
-            data['using_line'] = True
-            data['name'] = data['line'].split("@")[0].split("/")[-1]
-            return data
-
-        console.error('Cannot parse: {}'.format(original_line))
-        sys.exit(1)
 
     def _create_clone_dir(self, package):
         temp_dir = os.path.join(
             self.environment['clone_dir'],
-            package['name']
+            package.name
         )
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
         os.makedirs(temp_dir)
         return temp_dir
 
-    def _install_with_url(self, package):
-        temp_dir = self._create_clone_dir(package)
-        full_package_path = os.path.join(temp_dir, package['name'])
-        if 'bitbucket' in package['url']:
+    def _get_remote_url(self, package):
+        return "https://{}@{}".format(
+            self.bit_token if 'bitbucket' in package.url
+            else self.git_token,
+            package.url
+        )
+
+    def _fetch_shallow(self, package, full_package_path, output=None):
+        """Fetch only the package head, without history.
+
+        Blobs are fetched on demand if server supports partial clones.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            full_package_path (string): path for package repository
+            output (list, optional): buffer messages in this list
+
+        Returns
+        -------
+            Bool: fetch and checkout succeeded
+
+        """
+        os.makedirs(full_package_path)
+        return self._run_commands(
+            [
+                ["git", "init", "-q"],
+                [
+                    "git", "remote", "add", "origin",
+                    self._get_remote_url(package)
+                ],
+                [
+                    "git", "fetch", "--depth", "1", "--filter=blob:none",
+                    "origin", package.head if package.head else "HEAD"
+                ]
+            ],
+            cwd=full_package_path,
+            verbose=True,
+            output=output,
+            span=("clone", package.name)
+        ) and self._run_command(
+            ["git", "checkout", "-q", "FETCH_HEAD"],
+            cwd=full_package_path,
+            verbose=True,
+            output=output,
+            span=("checkout", package.name)
+        )
+
+    def _clone_full(self, package, full_package_path, output=None):
+        ret = self._run_command(
+            ["git", "clone", self._get_remote_url(package)],
+            cwd=os.path.dirname(full_package_path),
+            verbose=True,
+            output=output,
+            span=("clone", package.name)
+        )
+        if ret and package.head:
             ret = self._run_command(
-                "cd {} && git clone https://{}@{}".format(
-                    temp_dir, self.bit_token, package['url']),
-                verbose=True
+                ["git", "checkout", package.head],
+                cwd=full_package_path,
+                verbose=True,
+                output=output,
+                span=("checkout", package.name)
             )
+        return ret
+
+    def _get_mirror_path(self, package):
+        return os.path.join(
+            self.environment['clone_dir'],
+            ".mirrors",
+            "{}.git".format(package.url)
+        )
+
+    def _update_mirror(self, package, output=None):
+        """Create or update the bare mirror for package url.
+
+        Mirrors are kept between runs inside the ``.mirrors``
+        folder in clone_dir, so only new commits are fetched.
+        The token is used only in the fetch command and it is
+        not saved in mirror configuration.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            output (list, optional): buffer messages in this list
+
+        Returns
+        -------
+            Bool: mirror is updated
+
+        """
+        mirror_path = self._get_mirror_path(package)
+        if os.path.exists(os.path.join(mirror_path, "HEAD")):
+            self.metrics.inc("outpak_cache_hits", cache="mirror")
         else:
-            ret = self._run_command(
-                "cd {} && git clone https://{}@{}".format(
-                    temp_dir, self.git_token, package['url']),
-                verbose=True
-            )
-        if ret and package['head']:
-            branchs = self._run_command(
-                'cd {} && git fetch --all && git branch -a'.format(
-                    full_package_path),
-                get_stdout=True
+            self.metrics.inc("outpak_cache_misses", cache="mirror")
+            if os.path.exists(mirror_path):
+                shutil.rmtree(mirror_path)
+            os.makedirs(mirror_path)
+            if not self._run_command(
+                    ["git", "init", "-q", "--bare", mirror_path],
+                    verbose=True,
+                    output=output,
+                    span=("clone", package.name)):
+                return False
+        return self._run_command(
+            [
+                "git", "fetch", "-q", "--prune",
+                self._get_remote_url(package),
+                "+refs/heads/*:refs/heads/*",
+                "+refs/tags/*:refs/tags/*",
+                "+HEAD:refs/outpak/HEAD"
+            ],
+            cwd=mirror_path,
+            verbose=True,
+            output=output,
+            span=("clone", package.name)
+        )
+
+    def _checkout_from_mirror(self, package, full_package_path, output=None):
+        """Checkout package head from local mirror in a new worktree.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            full_package_path (string): path for package worktree
+            output (list, optional): buffer messages in this list
+
+        Returns
+        -------
+            Bool: checkout succeeded
+
+        """
+        if not self._update_mirror(package, output):
+            return False
+        return self._run_commands(
+            [
+                ["git", "worktree", "prune"],
+                [
+                    "git", "worktree", "add", "-q", "--detach",
+                    full_package_path,
+                    package.head if package.head
+                    else "refs/outpak/HEAD"
+                ]
+            ],
+            cwd=self._get_mirror_path(package),
+            verbose=True,
+            output=output,
+            span=("checkout", package.name)
+        )
+
+    def _clone_package(self, package, output=None):
+        """Clone package and checkout his head.
+
+        If ``use_mirror`` is set, the head is checkout from local
+        mirror. Else, try a shallow fetch for the head. Servers may
+        refuse it (ex.: abbreviated commits), so a full clone
+        is made in this case.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            output (list, optional): buffer messages in this list
+
+        Returns
+        -------
+            String: full path for cloned package or None if failed
+
+        """
+        temp_dir = self._create_clone_dir(package)
+        full_package_path = os.path.join(temp_dir, package.name)
+        if self.get_option('use_mirror', False):
+            if self._checkout_from_mirror(
+                    package, full_package_path, output):
+                return full_package_path
+            self._echo(
+                "Mirror checkout failed for {}. "
+                "Fetching from remote.".format(package.name),
+                output)
+            self.metrics.inc("outpak_retries", reason="mirror")
+            if os.path.exists(full_package_path):
+                shutil.rmtree(full_package_path)
+        ret = self._fetch_shallow(package, full_package_path, output)
+        if not ret:
+            self.metrics.inc("outpak_retries", reason="full_clone")
+            self._echo(
+                "Shallow fetch refused for {}. Using full clone.".format(
+                    package.name),
+                output)
+            shutil.rmtree(full_package_path)
+            ret = self._clone_full(package, full_package_path, output)
+        return full_package_path if ret else None
+
+    def _use_archive(self, package):
+        return bool(
+            self.get_option('use_archive', False) and
+            package.option != "-e"
+        )
+
+    def _get_archive_headers(self, package):
+        from outpak import __version__
+        headers = {'User-Agent': "outpak/{}".format(__version__)}
+        if 'bitbucket' in package.url:
+            headers['Authorization'] = "Basic {}".format(
+                base64.b64encode(
+                    self.bit_token.encode('utf-8')).decode('ascii'))
+        elif self.git_token:
+            headers['Authorization'] = "token {}".format(self.git_token)
+        return headers
+
+    def _download_archive(self, package, output=None):
+        """Download and extract source archive for package head.
+
+        Only heads resolved to a full commit are downloaded, and
+        the commit is saved in the ``.outpak-commit`` file, inside
+        the extracted folder.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            output (list, optional): buffer messages in this list
+
+        Returns
+        -------
+            String: full path for extracted package or None if failed
+
+        """
+        commit = self.resolve_head(package)
+        url = get_archive_url(
+            package.url,
+            commit,
+            self.get_option('archive_url')
+        ) if commit else None
+        if not url:
+            return None
+        temp_dir = self._create_clone_dir(package)
+        full_package_path = os.path.join(temp_dir, package.name)
+        archive_path = os.path.join(temp_dir, "source.tar.gz")
+        self._echo("Downloading {}".format(url), output, command=True)
+        try:
+            with self.timings.span("download", package.name):
+                download(
+                    url, archive_path, self._get_archive_headers(package))
+                os.makedirs(full_package_path)
+                extract(archive_path, full_package_path)
+        except ArchiveError as exc:
+            self._echo(str(exc), output)
+            shutil.rmtree(temp_dir)
+            return None
+        finally:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+        with open(os.path.join(full_package_path, COMMIT_FILE), "w") as file:
+            file.write(commit)
+        return full_package_path
+
+    def _get_size(self, path):
+        size = 0
+        for root, _, files in os.walk(path):
+            for filename in files:
+                try:
+                    size += os.lstat(os.path.join(root, filename)).st_size
+                except OSError:
+                    pass
+        return size
+
+    def _get_resolver(self):
+        if not self.resolver:
+            self.resolver = RefResolver(
+                os.path.join(self.environment['clone_dir'], ".refs.json"),
+                self._run_command,
+                ttl=int(self.get_option('ref_ttl', 300))
             )
-            if branchs and package['head'] in branchs:
-                ret = self._run_command(
-                    "cd {} && git checkout {}".format(
-                        full_package_path, package['head']),
-                    verbose=True
-                )
-            else:
-                ret = self._run_command(
-                    "cd {} && git reset --hard {}".format(
-                        full_package_path, package['head']),
-                    verbose=True
+        return self.resolver
+
+    def resolve_head(self, package):
+        """Resolve package head to a full commit.
+
+        Full commits are returned as is. Branches and tags are
+        resolved with ``git ls-remote`` and saved in cache.
+        Abbreviated commits cannot be resolved without clone.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+
+        Returns
+        -------
+            String: full commit or None if cannot be resolved
+
+        """
+        resolver = self._get_resolver()
+        commit = resolver.resolve(
+            package.url,
+            self._get_remote_url(package),
+            package.head
+        )
+        resolver.save()
+        return commit
+
+    def resolve_heads(self, package_list):
+        """Resolve heads for all git packages concurrently.
+
+        Args:
+            package_list (list): Data parsed from requirements.txt
+
+        Returns
+        -------
+            Dict: commit for each package url and head
+
+        """
+        return self._get_resolver().resolve_many(
+            [
+                (
+                    package.url,
+                    self._get_remote_url(package),
+                    package.head
                 )
-        if ret:
-            ret = self._run_command(
-                "cd {} && pip install {}.".format(
-                    full_package_path,
-                    "{} ".format(package['option'])
-                    if package['option'] else ""
-                ),
-                verbose=True
+                for package in package_list
+                if self._use_token(package)
+            ],
+            jobs=self._get_jobs()
+        )
+
+    def _use_wheel_cache(self, package):
+        return bool(
+            self.get_option('use_wheel_cache', False) and
+            package.option != "-e"
+        )
+
+    def _get_interpreter_tag(self):
+        return "{}-{}.{}-{}".format(
+            platform.python_implementation().lower(),
+            sys.version_info[0],
+            sys.version_info[1],
+            sysconfig.get_platform().replace("-", "_").replace(".", "_")
+        )
+
+    def _get_wheel_dir(self, package, commit):
+        return os.path.join(
+            self.environment['clone_dir'],
+            ".wheels",
+            package.url,
+            commit,
+            self._get_interpreter_tag()
+        )
+
+    def get_cached_wheel(self, package):
+        """Return cached wheel for package head.
+
+        Wheels are cached inside the ``.wheels`` folder in
+        clone_dir, for each url, commit and interpreter.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+
+        Returns
+        -------
+            String: full path for wheel or None if not found
+
+        """
+        commit = self.resolve_head(package)
+        if not commit and package.head and \
+                re.match(r"^[0-9a-f]{4,39}$", package.head):
+            commit = "{}*".format(package.head)
+        if not commit:
+            return None
+        wheels = sorted(glob.glob(
+            os.path.join(self._get_wheel_dir(package, commit), "*.whl")))
+        return wheels[0] if wheels else None
+
+    def _get_source_commit(self, full_package_path):
+        commit_path = os.path.join(full_package_path, COMMIT_FILE)
+        if os.path.exists(commit_path):
+            with open(commit_path) as file:
+                return file.read()
+        return self._run_command(
+            ["git", "rev-parse", "HEAD"],
+            cwd=full_package_path,
+            get_stdout=True
+        )
+
+    def _build_wheel(self, package, full_package_path, output=None):
+        """Build wheel for cloned package and save it in cache.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            full_package_path (string): path for cloned package
+            output (list, optional): buffer messages in this list
+
+        Returns
+        -------
+            String: full path for wheel or None if build failed
+
+        """
+        commit = self._get_source_commit(full_package_path)
+        if not commit:
+            return None
+        wheel_dir = self._get_wheel_dir(package, commit.strip())
+        build_dir = tempfile.mkdtemp(prefix="outpak-")
+        try:
+            if not self._run_command(
+                    ["pip", "wheel", "--no-deps", "-w", build_dir, "."],
+                    cwd=full_package_path,
+                    verbose=True,
+                    output=output,
+                    span=("build", package.name)):
+                return None
+            if os.path.exists(wheel_dir):
+                shutil.rmtree(wheel_dir)
+            elif not os.path.exists(os.path.dirname(wheel_dir)):
+                os.makedirs(os.path.dirname(wheel_dir))
+            shutil.move(build_dir, wheel_dir)
+        finally:
+            if os.path.exists(build_dir):
+                shutil.rmtree(build_dir)
+        wheels = glob.glob(os.path.join(wheel_dir, "*.whl"))
+        return wheels[0] if wheels else None
+
+    def _install_wheel(self, package, wheel):
+        """Install cached wheel and its dependencies.
+
+        A new commit usually keeps the same version, and pip skips
+        wheels for versions already installed, so the wheel is
+        always reinstalled, without its dependencies. Dependencies
+        are installed by a second command.
+        """
+        options = self._get_options(package) + self._get_constraints()
+        return self._run_commands(
+            [
+                ["pip", "install", "--force-reinstall", "--no-deps"] +
+                options + [wheel],
+                ["pip", "install"] + options + [wheel]
+            ],
+            verbose=True,
+            span=("install", package.name)
+        )
+
+    def fetch_package(self, package, output=None):
+        """Fetch package source.
+
+        This is the first stage in install pipeline.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            output (list, optional): buffer messages in this list
+
+        Returns
+        -------
+            Tuple: ("wheel", path) for cached wheels, ("path", path)
+                for cloned packages or None if failed
+
+        """
+        if self._use_wheel_cache(package):
+            wheel = self.get_cached_wheel(package)
+            if wheel:
+                self.metrics.inc("outpak_cache_hits", cache="wheel")
+                self._echo(
+                    "Using cached wheel {}".format(wheel),
+                    output,
+                    command=True)
+                return "wheel", wheel
+            self.metrics.inc("outpak_cache_misses", cache="wheel")
+        full_package_path = None
+        if self._use_archive(package):
+            full_package_path = self._download_archive(package, output)
+            if not full_package_path:
+                self.metrics.inc("outpak_retries", reason="archive")
+                self._echo(
+                    "Archive not available for {}. "
+                    "Fetching with git.".format(package.name),
+                    output)
+        if not full_package_path:
+            full_package_path = self._clone_package(package, output)
+        if not full_package_path:
+            self.metrics.inc("outpak_failures", phase="fetch")
+            return None
+        if self._use_metrics():
+            self.metrics.set(
+                "outpak_clone_bytes",
+                self._get_size(full_package_path),
+                package=package.name
             )
-        if not ret:
+        return "path", full_package_path
+
+    def build_package(self, package, source, output=None):
+        """Build wheel for fetched package, if wheel cache is used.
+
+        This is the second stage in install pipeline.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            source (tuple): source returned by fetch_package
+            output (list, optional): buffer messages in this list
+
+        Returns
+        -------
+            Tuple: ("wheel", path) for built wheels, the source
+                if no build is needed or None if failed
+
+        """
+        kind, path = source
+        if kind != "path" or not self._use_wheel_cache(package):
+            return source
+        wheel = self._build_wheel(package, path, output)
+        if not wheel:
+            self.metrics.inc("outpak_failures", phase="build")
+            return None
+        return "wheel", wheel
+
+    def _install_with_url(self, package, source=None):
+        if not source:
+            source = self.fetch_package(package)
+            if source:
+                source = self.build_package(package, source)
+        if not source:
+            return False
+        kind, path = source
+        if kind == "wheel":
+            return self._install_wheel(package, path)
+        return self._run_command(
+            ["pip", "install"] + self._get_options(package) +
+            self._get_constraints() + ["."],
+            cwd=path,
+            verbose=True,
+            span=("install", package.name)
+        )
+
+    def _get_jobs(self, key='jobs'):
+        jobs = self.get_option(key, 1)
+        try:
+            jobs = int(jobs)
+            if jobs < 1:
+                raise ValueError(jobs)
+        except (TypeError, ValueError):
+            console.error(
+                "Jobs must be a positive number, not: {}".format(jobs))
             sys.exit(1)
+        return jobs
 
     def _install_with_pip(self, package):
-        if package['using_line']:
-            task = 'pip install "{}"'.format(package['line'])
-        else:
-            task = "pip install {}{}{}{}{}{}".format(
-                "{} ".format(package['option']) if package['option'] else "",
-                package['name'],
-                '"' if package['signal'] and
-                package['signal'] != "=" else "",
-                "{}=".format(
-                    package['signal']) if package['signal'] else "",
-                package['version'] if package['version'] else "",
-                '"' if package['signal'] and
-                package['signal'] != "=" else "",
-            )
-        ret = self._run_command(
+        if package.hashes:
+            console.warning(
+                "Hashes for {} are not checked: pip checks hashes "
+                "only in requirements files. Use batch install "
+                "to check them.".format(package.name))
+        task = list(package.argv)
+        task[2:2] = self._get_constraints()
+        return self._run_command(
             task=task,
-            verbose=True
+            verbose=True,
+            span=("install", package.name)
         )
-        if not ret:
-            sys.exit(1)
 
-    def install_package(self, package):
+    def _get_options(self, package):
+        return [package.option] if package.option else []
+
+    def _use_token(self, package):
+        return parser.use_token(package)
+
+    def _get_requirement_line(self, package):
+        """Return package as a requirements file line.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+
+        Returns
+        -------
+            String: requirement line, with options, markers and hashes
+
+        """
+        if package.using_line:
+            line = package.line.strip()
+        else:
+            line = package.name + package.specifier
+        if package.option and not line.startswith(package.option):
+            line = "{} {}".format(package.option, line)
+        if package.hashes:
+            line = "{} {}".format(line, package.hashes)
+        return line
+
+    def _install_with_requirements_file(self, package_list):
+        with tempfile.NamedTemporaryFile(
+                mode="w", prefix="outpak-", suffix=".txt",
+                delete=False) as reqfile:
+            for package in package_list:
+                reqfile.write(
+                    "{}\n".format(self._get_requirement_line(package)))
+        try:
+            ret = self._run_command(
+                ["pip", "install"] + self._get_constraints() +
+                ["-r", reqfile.name],
+                verbose=True,
+                span=("install", "batch")
+            )
+        finally:
+            os.remove(reqfile.name)
+        return ret
+
+    def _get_requirement(self, package):
+        return parser.get_requirement(package)
+
+    def _is_requirement_installed(self, requirement, snapshot, extra=None):
+        """Check if requirement is satisfied by installed distributions.
+
+        Only the requirement itself and the requirements for its
+        extras are checked, not the full dependency tree.
+
+        Args:
+            requirement (Requirement): requirement to check
+            snapshot (dict): installed distributions
+            extra (string, optional): extra which need this requirement
+
+        Returns
+        -------
+            Bool: requirement is satisfied
+
+        """
+        if requirement.marker and not requirement.marker.evaluate(
+                {'extra': extra or ""}):
+            return True
+        distribution = snapshot.get(canonicalize_name(requirement.name))
+        if not distribution or not requirement.specifier.contains(
+                distribution.version, prereleases=True):
+            return False
+        for extra_name in requirement.extras:
+            for line in distribution.requires:
+                try:
+                    extra_requirement = Requirement(line)
+                except InvalidRequirement:
+                    return False
+                if extra_requirement.marker and \
+                        "extra" in str(extra_requirement.marker) and \
+                        not self._is_requirement_installed(
+                            extra_requirement, snapshot, extra_name):
+                    return False
+        return True
+
+    def is_installed(self, package, snapshot):
+        """Check if package is already installed.
+
+        Packages with markers, urls or options are never
+        considered installed, to let pip decide. Git packages are
+        installed if the installed commit matches the package head,
+        or the commit it resolves to, for branches and tags.
+
+        Args:
+            package (Requirement): package parsed from requirements.txt
+            snapshot (dict): installed distributions
+
+        Returns
+        -------
+            Bool: package is installed
+
+        """
+        if self._use_token(package):
+            from outpak.installed import get_installed_commit
+            distribution = snapshot.get(package.key)
+            if not distribution:
+                return False
+            commit = get_installed_commit(
+                distribution,
+                os.path.join(self.environment['clone_dir'], ".wheels")
+            )
+            if not commit:
+                return False
+            # Branches and tags may look like a commit prefix
+            # (ex.: "2021"), so only commits are compared directly.
+            if package.head and \
+                    re.match(r"^[0-9a-f]{7,40}$", package.head) and \
+                    commit.startswith(package.head):
+                return True
+            return commit == self.resolve_head(package)
+        requirement = self._get_requirement(package)
+        if not requirement or requirement.marker:
+            return False
+        return self._is_requirement_installed(requirement, snapshot)
+
+    def filter_installed(self, package_list):
+        """Remove packages already installed from list.
+
+        Installed distributions are read once, before checking
+        the packages.
+
+        Args:
+            package_list (list): Data parsed from requirements.txt
+
+        Returns
+        -------
+            List: packages which need install
+
+        """
+        from outpak.installed import get_snapshot
+        snapshot = get_snapshot()
+        install_list = [
+            package
+            for package in package_list
+            if not self.is_installed(package, snapshot)
+        ]
+        installed = len(package_list) - len(install_list)
+        self.metrics.set(
+            "outpak_packages", installed, state="already_installed")
+        if installed:
+            console.info(
+                "{} packages already installed.".format(installed))
+        return install_list
+
+    def install_batch(self, package_list):
+        """Install parsed packages using a single pip transaction.
+
+        If this command fails, each package is installed
+        separately, to find the failing one.
+
+        Args:
+            package_list (list): Data parsed from requirements.txt,
+                without packages which need a token clone
+        """
+        console.section(
+            "Installing {} packages using pip".format(len(package_list)))
+        if not self._install_with_requirements_file(package_list):
+            self.metrics.inc("outpak_retries", reason="batch")
+            console.warning(
+                "Batch install failed. "
+                "Installing packages one by one.")
+            for package in package_list:
+                self.install_package(package)
+        else:
+            self.metrics.inc(
+                "outpak_packages", len(package_list), state="installed")
+
+    def install_package(self, package, source=None):
         """Install parsed package.
 
+        This is the last stage in install pipeline.
+
         Args:
-            package (dict): Data parsed from package in requirements.txt
+            package (Requirement): package parsed from requirements.txt
+            source (tuple, optional): source returned by build_package,
+                for packages already fetched
         """
         console.section("Installing {} ({}{})".format(
-            package['name'],
-            package['signal'] if package['signal'] and
-            package['signal'] != "=" else "",
-            package['version'] if package['version'] else "latest"
+            package.name,
+            package.signal if package.signal and
+            package.signal != "=" else "",
+            package.version if package.version else "latest"
         ))
         console.info("Installing {}{}".format(
-            "at head {} ".format(package['head']) if package['head'] else "",
-            'using Token' if package['url'] else "using pip"
+            "at head {} ".format(package.head) if package.head else "",
+            'using Token' if package.url else "using pip"
         ), use_prefix=False)
 
-        if package['url'] and not package['using_line']:
-            self._install_with_url(package)
+        if self._use_token(package):
+            ret = self._install_with_url(package, source)
         else:
-            self._install_with_pip(package)
+            ret = self._install_with_pip(package)
+        if not ret:
+            self.metrics.inc("outpak_failures", phase="install")
+            sys.exit(1)
+        self.metrics.inc("outpak_packages", state="installed")
 
-    def run(self):
-        """Run instance."""
+    def get_fingerprint(self, file_list, package_list):
+        """Return fingerprint for current configuration.
+
+        Fingerprint changes if any of these changes: pak.yml,
+        pak.lock, selected environment, requirements files, python
+        interpreter or the commits resolved for git packages.
+
+        Args:
+            file_list (list): full path for requirements files
+            package_list (list): Data parsed from requirements.txt
+
+        Returns
+        -------
+            String: sha256 hex digest
+
+        """
+        fingerprint = hashlib.sha256()
+        path_list = [self.path] + file_list + self.constraint_files
+        if os.path.exists(self._get_lock_path()):
+            path_list.append(self._get_lock_path())
+        for path in path_list:
+            fingerprint.update(path.encode('utf-8'))
+            with open(path, 'rb') as file:
+                fingerprint.update(file.read())
+        for value in [
+                self.environment_name,
+                sys.executable,
+                sys.version]:
+            fingerprint.update(value.encode('utf-8'))
+        for package in package_list:
+            if self._use_token(package):
+                fingerprint.update("{}@{}".format(
+                    package.url,
+                    self.resolve_head(package) or package.head
+                ).encode('utf-8'))
+        return fingerprint.hexdigest()
+
+    def _get_stamp_path(self):
+        return os.path.join(
+            sys.prefix,
+            "outpak-{}.stamp".format(
+                hashlib.sha1(
+                    os.path.abspath(self.path).encode('utf-8')
+                ).hexdigest()[:12])
+        )
+
+    def read_stamp(self):
+        """Read fingerprint saved in last install.
+
+        Returns
+        -------
+            String: fingerprint or None if not found
+
+        """
+        try:
+            with open(self._get_stamp_path()) as file:
+                return json.load(file).get('fingerprint')
+        except (IOError, OSError, ValueError):
+            return None
+
+    def write_stamp(self, fingerprint):
+        """Save fingerprint in active environment.
+
+        Args:
+            fingerprint (string): fingerprint for current configuration
+        """
+        try:
+            with open(self._get_stamp_path(), 'w') as file:
+                json.dump({
+                    'path': os.path.abspath(self.path),
+                    'environment': self.environment_name,
+                    'fingerprint': fingerprint
+                }, file)
+        except (IOError, OSError) as exc:
+            console.warning("Cannot save stamp file: {}".format(exc))
+
+    def read_packages(self, file_list):
+        """Read and parse requirements files.
+
+        Files included with ``-r`` are read recursively, and
+        files included with ``-c`` are passed to pip as constraints.
+        Packages which markers do not apply to running interpreter
+        are removed. Packages found in many files are merged, and
+        conflicts between them are reported before any install.
+
+        Args:
+            file_list (list): full path for requirements files
+
+        Returns
+        -------
+            List: Data parsed from requirements.txt
+
+        """
+        try:
+            with self.timings.span("parse", "requirements"):
+                requirement_set = parser.read_requirements(
+                    file_list,
+                    cache_dir=os.path.join(
+                        self.environment['clone_dir'], ".parsed")
+                )
+        except parser.ParseError as exc:
+            console.error(str(exc))
+            sys.exit(1)
+        for file in requirement_set.files:
+            console.info("Reading {}.".format(file))
+        for file in requirement_set.constraints:
+            console.info("Using constraints from {}.".format(file))
+        self.requirement_files = requirement_set.files
+        self.constraint_files = requirement_set.constraints
+
+        package_list = parser.evaluate_markers(requirement_set.packages)
+        skipped = len(requirement_set.packages) - len(package_list)
+        if skipped:
+            console.info(
+                "{} packages skipped by markers.".format(skipped))
+
+        merged = len(package_list)
+        package_list, conflicts = parser.merge_packages(package_list)
+        if conflicts:
+            for conflict in conflicts:
+                console.error(conflict)
+            sys.exit(1)
+        merged -= len(package_list)
+        if merged:
+            console.info("{} duplicated packages merged.".format(merged))
+        return package_list
+
+    def _get_wheelhouse_path(self):
+        return self.get_option('wheelhouse') or os.path.join(
+            self.environment['clone_dir'], ".wheelhouse")
+
+    def _get_constraints(self):
+        constraints = []
+        for file in self.constraint_files:
+            constraints += ["-c", file]
+        return constraints
+
+    def _get_lock_path(self):
+        return os.path.join(os.path.dirname(self.path), "pak.lock")
+
+    def _get_lock_key(self, package):
+        return "{}@{}".format(package.url, package.head) \
+            if package.head else package.url
+
+    def read_lock(self):
+        """Read locked data for current environment from pak.lock.
+
+        Returns
+        -------
+            Dict: locked ``heads`` and ``packages`` or None if
+                not found
+
+        """
+        lock_path = self._get_lock_path()
+        if not os.path.exists(lock_path):
+            return None
+        import yaml
+        try:
+            with open(lock_path) as file:
+                data = yaml.load(
+                    file.read(),
+                    Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+                ) or {}
+        except (IOError, yaml.YAMLError) as exc:
+            console.error("Cannot read lock file: {}".format(exc))
+            sys.exit(1)
+        return data.get('envs', {}).get(self.environment_name)
+
+    def apply_lock(self, package_list):
+        """Replace heads and versions with values locked in pak.lock.
+
+        Locked versions which do not satisfy the package
+        specifier are ignored.
+
+        Args:
+            package_list (list): Data parsed from requirements.txt
+
+        Returns
+        -------
+            List: Data parsed from requirements.txt, with locked values
+
+        """
+        lock = self.read_lock()
+        if not lock:
+            return package_list
+        console.info("Using lock file: {}".format(self._get_lock_path()))
+        heads = lock.get('heads') or {}
+        versions = lock.get('packages') or {}
+        locked_list = []
+        for package in package_list:
+            if self._use_token(package):
+                commit = heads.get(self._get_lock_key(package))
+                if commit:
+                    package = package.replace(head=commit)
+                locked_list.append(package)
+                continue
+            requirement = self._get_requirement(package)
+            if requirement:
+                version = versions.get(canonicalize_name(requirement.name))
+                if version and requirement.specifier.contains(
+                        str(version), prereleases=True):
+                    package = self.parse_line("{}{}=={}{}".format(
+                        requirement.name,
+                        "[{}]".format(",".join(sorted(requirement.extras)))
+                        if requirement.extras else "",
+                        version,
+                        " ; {}".format(requirement.marker)
+                        if requirement.marker else ""
+                    )).replace(hashes=package.hashes)
+                elif version:
+                    console.warning(
+                        "Locked version {} for {} ignored. "
+                        "Please update pak.lock.".format(
+                            version, requirement.name))
+            locked_list.append(package)
+        return locked_list
+
+    def _resolve_versions(self, package_list):
+        """Resolve versions for pip packages using pip resolver.
+
+        Args:
+            package_list (list): Data parsed from requirements.txt
+
+        Returns
+        -------
+            Dict: version for each normalized package name
+
+        """
+        requirements = [
+            requirement
+            for requirement in [
+                self._get_requirement(package)
+                for package in package_list
+            ]
+            if requirement
+        ]
+        if not requirements:
+            return {}
+        report_dir = tempfile.mkdtemp(prefix="outpak-")
+        try:
+            report_path = os.path.join(report_dir, "report.json")
+            reqfile_path = os.path.join(report_dir, "requirements.txt")
+            with open(reqfile_path, "w") as reqfile:
+                for requirement in requirements:
+                    reqfile.write("{}\n".format(requirement))
+            if not self._run_command(
+                    [
+                        "pip", "install", "--dry-run", "--ignore-installed",
+                        "--quiet", "--report", report_path,
+                        "-r", reqfile_path
+                    ] + self._get_constraints(),
+                    verbose=True,
+                    span=("resolve", "pip")):
+                return None
+            with open(report_path) as file:
+                report = json.load(file)
+        finally:
+            shutil.rmtree(report_dir)
+        resolved = {
+            canonicalize_name(item['metadata']['name']):
+            item['metadata']['version']
+            for item in report.get('install', [])
+        }
+        return {
+            canonicalize_name(requirement.name):
+            resolved[canonicalize_name(requirement.name)]
+            for requirement in requirements
+            if canonicalize_name(requirement.name) in resolved
+        }
+
+    def report_timings(self):
+        """Print time spent in each phase for each package.
+
+        Enabled with the ``timings`` option. If the ``trace`` option
+        is set, save all spans in a Chrome trace event file too.
+        """
+        if not self.timings.spans:
+            return
+        if self.get_option('timings', False):
+            console.section("Timings")
+            for line in self.timings.format_summary():
+                console.info(line, use_prefix=False)
+        trace_path = self.get_option('trace', None)
+        if trace_path:
+            self.timings.save_trace(trace_path)
+            console.info("Trace saved in {}".format(trace_path))
+
+    def lock(self):
+        """Write pak.lock for current environment.
+
+        Each git package head is resolved to a commit, and each
+        pip package is pinned to the version found by pip resolver.
+        Next installs will use these values.
+        """
+        try:
+            self._lock()
+        finally:
+            self.report_timings()
+
+    def _lock(self):
+        """Resolve heads and versions and save lock file."""
+        file_list = self.load()
+        package_list = self.read_packages(file_list)
+
+        console.section("Resolving git heads")
+        self._get_resolver().ttl = 0
+        heads = self.resolve_heads(package_list)
+        error = False
+        for key in sorted(heads):
+            if heads[key]:
+                console.info(
+                    "{}: {}".format(key, heads[key]), use_prefix=False)
+            else:
+                error = True
+                console.error("Cannot resolve head for {}".format(key))
+
+        console.section("Resolving pip versions")
+        versions = self._resolve_versions(package_list)
+        if versions is None:
+            error = True
+            console.error("Cannot resolve versions using pip.")
+        if error:
+            sys.exit(1)
+
+        import yaml
+        lock_path = self._get_lock_path()
+        data = {}
+        if os.path.exists(lock_path):
+            with open(lock_path) as file:
+                data = yaml.load(
+                    file.read(),
+                    Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+                ) or {}
+        data['version'] = "1"
+        data.setdefault('envs', {})[self.environment_name] = {
+            'heads': heads,
+            'packages': versions
+        }
+        with open(lock_path, "w") as file:
+            yaml.dump(
+                data,
+                file,
+                Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+                default_flow_style=False
+            )
+        console.success("Lock saved in {}".format(lock_path))
+
+    def bundle(self, bundle_path=None):
+        """Save wheels for all packages in a bundle file.
+
+        Args:
+            bundle_path (string, optional): full path for bundle,
+                default is ``outpak-<environment>.tar.gz`` in
+                current directory
+        """
+        try:
+            self._bundle(bundle_path)
+        finally:
+            self.report_timings()
+
+    def _bundle(self, bundle_path):
+        """Prefetch all packages and save them with a manifest."""
+        from outpak import __version__
+        from outpak.wheelhouse import Wheelhouse
+        file_list = self.load()
+        package_list = self.apply_lock(self.read_packages(file_list))
+        self.resolve_heads(package_list)
+        if not bundle_path:
+            bundle_path = os.path.join(
+                os.getcwd(),
+                "outpak-{}.tar.gz".format(self.environment_name.lower()))
+
+        temp_dir = tempfile.mkdtemp(prefix="outpak-")
+        try:
+            wheel_dir = os.path.join(temp_dir, BUNDLE_FOLDER)
+            wheelhouse = Wheelhouse(
+                self, wheel_dir, jobs=self._get_jobs()
+            )
+            lines = wheelhouse.prefetch(package_list)
+            manifest = {
+                'version': "1",
+                'outpak': __version__,
+                'environment': self.environment_name,
+                'interpreter': self._get_interpreter_tag(),
+                'requirements': lines,
+                'reinstall': [
+                    os.path.basename(wheel)
+                    for wheel in wheelhouse.git_wheels
+                ],
+                'wheels': sorted(
+                    filename for filename in os.listdir(wheel_dir)
+                    if filename.endswith(".whl"))
+            }
+            with open(os.path.join(wheel_dir, BUNDLE_MANIFEST), "w") as file:
+                json.dump(manifest, file, indent=2)
+            import tarfile
+            with tarfile.open(bundle_path, "w:gz") as archive:
+                archive.add(wheel_dir, arcname=BUNDLE_FOLDER)
+        finally:
+            shutil.rmtree(temp_dir)
+        console.success("Bundle with {} wheels saved in {}".format(
+            len(manifest['wheels']), bundle_path))
+
+    def install_bundle(self, bundle_path):
+        """Install packages from bundle file.
+
+        Only the wheels inside the bundle are used, so no tokens,
+        network or pak.yml are needed.
+
+        Args:
+            bundle_path (string): full path for bundle
+        """
+        success = False
+        try:
+            self._install_bundle(bundle_path)
+            success = True
+        except SystemExit as exc:
+            success = not exc.code
+            raise
+        finally:
+            self.report_timings()
+            self.save_metrics(success)
+
+    def _install_bundle(self, bundle_path):
+        """Extract bundle and install its requirements offline."""
+        from outpak.wheelhouse import Wheelhouse
+        temp_dir = tempfile.mkdtemp(prefix="outpak-")
+        try:
+            try:
+                extract(bundle_path, temp_dir)
+                with open(os.path.join(temp_dir, BUNDLE_MANIFEST)) as file:
+                    manifest = json.load(file)
+            except (ArchiveError, IOError, OSError, ValueError) as exc:
+                console.error("Invalid bundle {}: {}".format(
+                    bundle_path, exc))
+                sys.exit(1)
+            self.environment_name = manifest['environment']
+            if manifest['interpreter'] != self._get_interpreter_tag():
+                console.warning(
+                    "Bundle was built for {}, not {}.".format(
+                        manifest['interpreter'],
+                        self._get_interpreter_tag()))
+            console.section(
+                "Installing {} packages from bundle {}".format(
+                    len(manifest['requirements']), bundle_path))
+            if not Wheelhouse(self, temp_dir).install(
+                    manifest['requirements'],
+                    manifest.get('reinstall')):
+                self.metrics.inc("outpak_failures", phase="install")
+                console.error("Cannot install packages from bundle.")
+                sys.exit(1)
+            self.metrics.inc(
+                "outpak_packages", len(manifest['requirements']),
+                state="installed")
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def load(self):
+        """Load configuration for current environment.
+
+        Returns
+        -------
+            List: full path for existing requirements files
+
+        """
         self.load_from_yaml()
         self.validate_data_from_yaml()
         self.get_current_environment()
@@ -559,31 +1721,107 @@ class Outpak():
         file_list = self.get_files()
         if not file_list:
             sys.exit(0)
+        return file_list
 
-        package_list = []
-        for file in file_list:
-            console.info("Reading {}.".format(file))
+    def _use_metrics(self):
+        return bool(
+            self.get_option('metrics_file') or
+            self.get_option('metrics_json')
+        )
 
-            with open(file) as reqfile:
-                file_list = []
-                read_line = ""
-                for line in reqfile:
-                    if line.strip().startswith("#") or \
-                            line.strip().startswith("-r") or \
-                            line.strip().replace("\n", "") == "":
-                        continue
-                    if "\\" in line:
-                        read_line += "".join(
-                            line.strip().split("\\")[0]
-                        )
-                        continue
-                    elif not read_line:
-                        read_line = line
-                    read_line = read_line.replace("\n", "").strip()
-                    if read_line != "":
-                        file_list.append(self.parse_line(read_line))
-                    read_line = ""
-            package_list += file_list
+    def save_metrics(self, success):
+        """Save metrics for current run.
 
-        for package in package_list:
-            self.install_package(package)
+        The OpenMetrics textfile is saved in ``metrics_file`` and
+        the JSON summary in ``metrics_json``, if these options are
+        set. All metrics have the ``env`` label, with the current
+        environment name.
+
+        Args:
+            success (bool): run succeeded
+        """
+        if not self._use_metrics():
+            return
+        end = time.time()
+        self.metrics.set("outpak_run_success", int(success))
+        self.metrics.set(
+            "outpak_run_duration_seconds",
+            round(end - self.timings.start, 3))
+        self.metrics.set("outpak_last_run_timestamp_seconds", int(end))
+        if self.resolver:
+            self.metrics.set(
+                "outpak_cache_hits", self.resolver.hits, cache="ref")
+            self.metrics.set(
+                "outpak_cache_misses", self.resolver.misses, cache="ref")
+        phases = {}
+        for phase, name, duration in self.timings.get_summary():
+            phases[phase] = phases.get(phase, 0) + duration
+            self.metrics.set(
+                "outpak_package_phase_seconds", round(duration, 3),
+                phase=phase, package=name)
+        for phase, duration in phases.items():
+            self.metrics.set(
+                "outpak_phase_seconds", round(duration, 3), phase=phase)
+        labels = {'env': self.environment_name}
+        for key, save in [
+                ('metrics_file', self.metrics.save_textfile),
+                ('metrics_json', self.metrics.save_json)]:
+            path = self.get_option(key)
+            if not path:
+                continue
+            try:
+                save(path, labels)
+            except (IOError, OSError) as exc:
+                console.warning("Cannot save metrics file: {}".format(exc))
+
+    def run(self):
+        """Run instance."""
+        success = False
+        try:
+            self._run()
+            success = True
+        except SystemExit as exc:
+            success = not exc.code
+            raise
+        finally:
+            self.report_timings()
+            self.save_metrics(success)
+
+    def _run(self):
+        """Read, resolve and install packages."""
+        file_list = self.load()
+
+        package_list = self.apply_lock(self.read_packages(file_list))
+        self.metrics.set(
+            "outpak_packages", len(package_list), state="requested")
+        self.resolve_heads(package_list)
+
+        fingerprint = self.get_fingerprint(
+            self.requirement_files, package_list)
+        if not self.get_option('force', False):
+            stamp_hit = fingerprint == self.read_stamp()
+            self.metrics.set("outpak_stamp_hit", int(stamp_hit))
+            if stamp_hit:
+                console.success("Configuration unchanged. Nothing to do.")
+                return
+            package_list = self.filter_installed(package_list)
+            if not package_list:
+                console.success("All packages are already installed.")
+                self.write_stamp(fingerprint)
+                return
+
+        if self.get_option('prefetch', False):
+            from outpak.wheelhouse import Wheelhouse
+            Wheelhouse(
+                self,
+                self._get_wheelhouse_path(),
+                jobs=self._get_jobs()
+            ).run(package_list)
+        else:
+            from outpak.pipeline import Pipeline
+            Pipeline(
+                self,
+                fetch_jobs=self._get_jobs(),
+                build_jobs=self._get_jobs('build_jobs')
+            ).run(package_list, batch=self.get_option('batch', False))
+        self.write_stamp(fingerprint)
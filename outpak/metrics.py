@@ -0,0 +1,159 @@
+"""Metrics module."""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+METRICS = OrderedDict([
+    ("outpak_run_success", "1 if last run succeeded, else 0"),
+    ("outpak_run_duration_seconds", "Duration of last run"),
+    ("outpak_last_run_timestamp_seconds", "Time when last run finished"),
+    ("outpak_stamp_hit", "1 if configuration was unchanged"),
+    ("outpak_packages", "Packages in last run, by state"),
+    ("outpak_cache_hits", "Cache hits in last run, by cache"),
+    ("outpak_cache_misses", "Cache misses in last run, by cache"),
+    ("outpak_retries", "Retries in last run, by reason"),
+    ("outpak_failures", "Failures in last run, by phase"),
+    ("outpak_clone_bytes", "Disk size of each cloned package"),
+    ("outpak_phase_seconds", "Time spent in each phase"),
+    ("outpak_package_phase_seconds",
+     "Time spent in each phase for each package"),
+])
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace(
+        "\"", "\\\"").replace("\n", "\\n")
+
+
+def _write(path, text):
+    """Write file atomically, so scrapers never read half files."""
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "w") as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+class Metrics():
+    """Collect metrics for one run.
+
+    All metrics are gauges with values from the last run, so
+    textfiles can be replaced after each run. Values can be
+    changed from many threads.
+
+    Attributes
+    ----------
+        values (dict): value for each metric name and labels
+
+    """
+
+    def __init__(self):
+        """Initialize class."""
+        self.values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_key(self, name, labels):
+        if name not in METRICS:
+            raise ValueError("Unknown metric: {}".format(name))
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Add value to metric.
+
+        Args:
+            name (string): metric name
+            value (number, optional): value to add
+            labels (dict): metric labels
+        """
+        key = self._get_key(name, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set metric value.
+
+        Args:
+            name (string): metric name
+            value (number): metric value
+            labels (dict): metric labels
+        """
+        key = self._get_key(name, labels)
+        with self._lock:
+            self.values[key] = value
+
+    def get(self, name, **labels):
+        """Return metric value.
+
+        Args:
+            name (string): metric name
+            labels (dict): metric labels
+
+        Returns
+        -------
+            Number: metric value, 0 if not set
+
+        """
+        return self.values.get(self._get_key(name, labels), 0)
+
+    def _get_samples(self, labels):
+        """Return metrics in METRICS order, with common labels added."""
+        samples = []
+        for name in METRICS:
+            for (key_name, key_labels), value in self.values.items():
+                if key_name == name:
+                    samples.append(
+                        (name, OrderedDict(
+                            sorted(labels.items()) + list(key_labels)),
+                         value))
+        return samples
+
+    def format_openmetrics(self, labels=None):
+        """Return metrics in OpenMetrics text format.
+
+        Args:
+            labels (dict, optional): labels added to all metrics
+
+        Returns
+        -------
+            String: metrics text
+
+        """
+        lines = []
+        last_name = None
+        for name, sample_labels, value in self._get_samples(labels or {}):
+            if name != last_name:
+                lines.append("# HELP {} {}".format(name, METRICS[name]))
+                lines.append("# TYPE {} gauge".format(name))
+                last_name = name
+            lines.append("{}{} {}".format(
+                name,
+                "{{{}}}".format(",".join(
+                    "{}=\"{}\"".format(key, _escape(label))
+                    for key, label in sample_labels.items()))
+                if sample_labels else "",
+                repr(float(value)) if isinstance(value, float) else value
+            ))
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def save_textfile(self, path, labels=None):
+        """Save metrics in OpenMetrics textfile.
+
+        Args:
+            path (string): full path for textfile
+            labels (dict, optional): labels added to all metrics
+        """
+        _write(path, self.format_openmetrics(labels))
+
+    def save_json(self, path, labels=None):
+        """Save metrics as JSON summary.
+
+        Args:
+            path (string): full path for JSON file
+            labels (dict, optional): labels added to all metrics
+        """
+        data = OrderedDict()
+        for name, sample_labels, value in self._get_samples(labels or {}):
+            data.setdefault(name, []).append(
+                {"labels": sample_labels, "value": value})
+        _write(path, json.dumps(data, indent=2) + "\n")
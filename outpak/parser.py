@@ -0,0 +1,741 @@
+"""Requirements parser module.
+
+Parse requirements files in a single pass: each physical line is
+read once, continuation lines are joined, comments and blank lines
+are skipped, and each logical line is classified by its prefix
+using precompiled patterns.
+"""
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict, namedtuple
+import packaging.requirements
+from packaging.specifiers import InvalidSpecifier, SpecifierSet
+from packaging.utils import canonicalize_name
+from packaging.version import InvalidVersion, Version
+
+
+# Pattern for fixed requirements: (.+)(>|=|~|<)=(\S+)
+SPECIFIER = re.compile(r"(.+)(>|=|~|<)=(\S+)")
+# Pattern for requirements with extras: SomeProject[foo, bar]
+EXTRAS = re.compile(r"(.+\[.+\])")
+# Hash-checking options, kept for installs using requirements files
+HASH_OPTION = re.compile(r"\s+--hash[=\s](\S+)")
+EGG = re.compile(r"#egg=([^&]+)")
+GIT_PROTOCOL = re.compile(r"(git:\/\/)(.+)#")
+GIT_PLUS_PROTOCOL = re.compile(r"(git\+\w+:\/\/)(.+)#")
+GIT_PLUS_SSH = re.compile(r"(git\+git@)(.+)#")
+
+# git urls patterns, checked in order: (pattern, scp-like url)
+# git://git.myproject.org/MyProject@1234abcd#egg=MyProject
+# git+https://git.myproject.org/MyProject@1234abcd#egg=MyProject
+# git+git@git.myproject.org:MyProject@1234abcd#egg=MyProject
+GIT_PATTERNS = (
+    (GIT_PROTOCOL, False),
+    (GIT_PLUS_PROTOCOL, False),
+    (GIT_PLUS_SSH, True)
+)
+
+VCS_PREFIXES = ("hg+", "svn+", "bzr+")
+PROJECT_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+# Include options: -r other.txt, --requirement=other.txt, -c constraints.txt
+INCLUDE = re.compile(
+    r"^(-r|--requirement|-c|--constraint)(?:\s*=\s*|\s*)(\S+)$")
+INCLUDE_KINDS = {
+    "-r": "requirement",
+    "--requirement": "requirement",
+    "-c": "constraint",
+    "--constraint": "constraint"
+}
+
+RequirementSet = namedtuple(
+    "RequirementSet",
+    ["packages", "constraints", "files"]
+)
+
+# Change this version if parser output changes, to discard
+# parsed files saved in disk cache
+PARSER_VERSION = "6"
+
+# Requirement fields computed from the other fields
+DERIVED_FIELDS = ("key", "specifier", "argv")
+
+# Parsed files, memoized by full path: (mtime, entries)
+_file_cache = {}
+
+EMPTY = {
+    "name": None,
+    "signal": None,
+    "version": None,
+    "url": None,
+    "head": None,
+    "egg": None,
+    "line": None,
+    "using_line": False,
+    "option": "",
+    "vcs": None,
+    "hashes": ""
+}
+
+
+class ParseError(ValueError):
+    """Requirement line cannot be parsed."""
+
+
+class Requirement(namedtuple("Requirement", [
+        "name", "signal", "version", "url", "head", "egg", "line",
+        "using_line", "option", "vcs", "hashes", "key", "specifier",
+        "argv"])):
+    """Parsed requirement line.
+
+    Requirements are immutable and hashable. Use ``replace`` to
+    get a copy with other values: ``key``, ``specifier`` and
+    ``argv`` are computed from the other fields.
+
+    Attributes
+    ----------
+        name (string): project name, path or url found in line
+        signal (string): version operator, without "=" (ex.: ">")
+        version (string): version after operator
+        url (string): git url, without protocol and head
+        head (string): git branch, tag or commit
+        egg (string): egg name
+        line (string): line passed to pip, if ``using_line``
+        using_line (bool): install line as is
+        option (string): pip option (ex.: "-e")
+        vcs (string): version control system (git, hg, svn, bzr)
+        hashes (string): hash-checking options
+            (ex.: "--hash=sha256:abcd")
+        key (string): normalized project name (PEP 503), or None
+            for paths and urls without egg
+        specifier (string): version specifier (ex.: ">=1.0")
+        argv (tuple): pip command to install requirement
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, name=None, signal=None, version=None, url=None,
+               head=None, egg=None, line=None, using_line=False,
+               option="", vcs=None, hashes=""):
+        """Create requirement and compute its derived fields.
+
+        Returns
+        -------
+            Requirement: new requirement
+
+        """
+        specifier = "{}={}".format(signal, version) if signal else ""
+        key = None
+        project = egg
+        if not project and name and not (
+                using_line and ("/" in name or ":" in name)):
+            m = PROJECT_NAME.match(name)
+            project = m.group(0) if m else None
+        if project:
+            key = canonicalize_name(project)
+            if key == project:  # share string with name
+                key = project
+        return cls(name, signal, version, url, head, egg, line, using_line,
+                   option, vcs, hashes, key, specifier,
+                   _get_argv(name, specifier, line, using_line, option))
+
+    def replace(self, **kwargs):
+        """Return a copy with new values.
+
+        Returns
+        -------
+            Requirement: new requirement
+
+        """
+        data = self._asdict()
+        for field in DERIVED_FIELDS:
+            del data[field]
+        data.update(kwargs)
+        return self.create(**data)
+
+
+def _get_argv(name, specifier, line, using_line, option):
+    if using_line:
+        return ("pip", "install", line)
+    return ("pip", "install") + ((option,) if option else ()) + (
+        (name or "") + specifier,)
+
+
+def iter_lines(lines):
+    """Return logical lines from requirements file.
+
+    Skip comments and blank lines, and join lines ending
+    with backslash.
+
+    Args:
+        lines (iterable): physical lines from requirements file
+
+    Yields
+    ------
+        String: logical line
+
+    """
+    buffer = []
+    for line in lines:
+        line = line.strip()
+        if not buffer and (not line or line[0] == "#"):
+            continue
+        if line.endswith("\\"):
+            buffer.append(line[:-1].strip())
+            continue
+        if buffer:
+            buffer.append(line)
+            line = " ".join(buffer).strip()
+            buffer = []
+        if line:
+            yield line
+    if buffer:
+        line = " ".join(buffer).strip()
+        if line:
+            yield line
+
+
+def get_include(line):
+    """Return include option from line.
+
+    Args:
+        line (string): logical line from requirements file
+
+    Returns
+    -------
+        Tuple: kind ("requirement" or "constraint") and path,
+            or None if line is not an include
+
+    """
+    if line[:1] != "-":
+        return None
+    m = INCLUDE.match(line.split(" #")[0].strip())
+    if not m:
+        return None
+    return INCLUDE_KINDS[m.group(1)], m.group(2)
+
+
+def _parse_url(data, url):
+    if "@" in url:
+        data['head'] = url.split("@")[-1]
+        url = url.split("@")[0]
+    data['url'] = url
+    data['name'] = url.split("/")[-1]
+    return data
+
+
+def _parse_egg(data, line):
+    m = EGG.search(line) if "#egg=" in line else None
+    if m:
+        data['egg'] = m.group(1)
+
+
+def _parse_git(data, line):
+    _parse_egg(data, line)
+    data['vcs'] = "git"
+    for pattern, scp_like in GIT_PATTERNS:
+        m = pattern.search(line)
+        if m:
+            url = m.group(2).replace(".git", "")
+            if scp_like:
+                url = url.replace(":", "/")
+            return _parse_url(data, url)
+    return None
+
+
+def _parse_http(data, line):
+    # https://git.myproject.org/MyProject@commit1234#egg=MyProject
+    _parse_egg(data, line)
+    data['line'] = line.split("#")[0]
+    data['using_line'] = True
+    data['name'] = data['line'].split("@")[0].split("/")[-1]
+    return data
+
+
+def _parse_as_line(data, line):
+    # SomeProject
+    # ./packages/my_package
+    # hg+http://hg.myproject.org/MyProject#egg=MyProject
+    _parse_egg(data, line)
+    data['name'] = line
+    data['line'] = line
+    data['using_line'] = True
+    return data
+
+
+def parse_line(line):
+    """Parse requirement line.
+
+    Check order is:
+
+    1. Lines with markers (ex.: SomeProject; python_version < '2.7')
+    2. Fixed requirements (ex.: requests==2.18.4)
+    3. Requirements with extras (ex.: requests[security]), other
+       specifiers are parsed as latest requirements
+    4. Latest requirements and paths (ex.: django)
+    5. hg, svn and bzr urls
+    6. git urls (git://, git+https://, git+git@)
+    7. http urls
+
+    Args:
+        line (string): logical line from requirements file
+
+    Raises
+    ------
+        ParseError: if line cannot be parsed
+
+    Returns
+    -------
+        Requirement: parsed requirement
+
+    """
+    return Requirement.create(**_parse_data(line))
+
+
+def _parse_data(line):
+    data = dict(EMPTY)
+    if "--hash" in line:
+        data['hashes'] = " ".join(
+            "--hash={}".format(value) for value in HASH_OPTION.findall(line))
+        line = HASH_OPTION.sub("", line)
+    original_line = line
+    line = line.split(" #")[0].strip().replace("\n", "").replace(" ", "")
+
+    if line[:1] == "-":
+        if line.startswith("-r"):
+            raise ParseError("Line {} ignored.".format(line))
+        data['option'] = line[0:2]
+        if data['option'] != "-e":
+            data['line'] = line
+            data['using_line'] = True
+        line = line[2:]
+
+    if ";" in line:
+        data['name'] = line.split(";")[0]
+        data['using_line'] = True
+        data['line'] = original_line.split(" #")[0].strip()
+        return data
+
+    m = SPECIFIER.match(line) if "=" in line else None
+    if m:
+        data["name"] = m.group(1)
+        data["signal"] = m.group(2)
+        data["version"] = m.group(3)
+        return data
+
+    m = EXTRAS.fullmatch(line) if "[" in line else None
+    if m:
+        data["name"] = m.group(1)
+        return data
+
+    if "+" not in line and "//" not in line:
+        return _parse_as_line(data, line)
+
+    for prefix in VCS_PREFIXES:
+        if prefix in line:
+            data['vcs'] = prefix[:-1]
+            return _parse_as_line(data, line)
+
+    if line.startswith("git"):
+        parsed = _parse_git(data, line)
+        if parsed:
+            return parsed
+
+    if line.startswith("http"):
+        return _parse_http(data, line)
+
+    raise ParseError("Cannot parse: {}".format(original_line))
+
+
+def parse_lines(lines):
+    """Parse requirements file in a single pass.
+
+    Args:
+        lines (iterable): physical lines from requirements file
+
+    Raises
+    ------
+        ParseError: if any line cannot be parsed
+
+    Returns
+    -------
+        List: requirement for each package
+
+    """
+    return [parse_line(line) for line in iter_lines(lines)]
+
+
+def _get_cache_path(cache_dir, content):
+    digest = hashlib.sha256(PARSER_VERSION.encode('utf-8'))
+    digest.update(content)
+    return os.path.join(cache_dir, "{}.json".format(digest.hexdigest()))
+
+
+def _read_cache(cache_path):
+    """Read parsed file from disk cache.
+
+    Requirements are saved without argv, which is rebuilt here.
+    Other derived fields are read as saved, so names are not
+    normalized again.
+    """
+    try:
+        with open(cache_path) as file:
+            data = json.load(file)
+        return [
+            ("package", Requirement._make(value + [_get_argv(
+                value[0], value[12], value[6], value[7], value[8])]))
+            if kind == "package" else (kind, value)
+            for kind, value in data
+        ]
+    except (IOError, OSError, IndexError, TypeError, ValueError):
+        return None
+
+
+def _write_cache(cache_path, entries):
+    try:
+        directory = os.path.dirname(cache_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = "{}.{}".format(cache_path, os.getpid())
+        with open(temp_path, "w") as file:
+            json.dump([
+                (kind, value[:-1] if kind == "package" else value)
+                for kind, value in entries
+            ], file)
+        os.rename(temp_path, cache_path)
+    except (IOError, OSError):
+        pass
+
+
+def parse_file(path, cache_dir=None):
+    """Parse requirements file.
+
+    Result is memoized by path and modification time, so each
+    file is parsed once, even if included many times. If
+    ``cache_dir`` is set, result is saved in disk too, keyed by
+    file contents and parser version, so next runs do not need
+    to parse the file again.
+
+    Args:
+        path (string): full path for requirements file
+        cache_dir (string, optional): directory for parsed files
+
+    Raises
+    ------
+        ParseError: if any line cannot be parsed
+
+    Returns
+    -------
+        List: tuples with kind ("package", "requirement" or
+            "constraint") and package data or included path
+
+    """
+    mtime = os.stat(path).st_mtime
+    cached = _file_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "rb") as file:
+        content = file.read()
+    cache_path = _get_cache_path(cache_dir, content) if cache_dir else None
+    entries = _read_cache(cache_path) if cache_path else None
+    if entries is None:
+        entries = []
+        for line in iter_lines(content.decode('utf-8').splitlines()):
+            include = get_include(line)
+            if include:
+                entries.append(include)
+            else:
+                entries.append(("package", parse_line(line)))
+        if cache_path:
+            _write_cache(cache_path, entries)
+    _file_cache[path] = (mtime, entries)
+    return entries
+
+
+def read_requirements(path_list, cache_dir=None):
+    """Read requirements files, following ``-r`` and ``-c`` options.
+
+    Included paths are relative to the including file. Each
+    file is read once, and its packages are added once, in the
+    order they are found. Constraint files are not parsed: they
+    are passed to pip.
+
+    Args:
+        path_list (list): path for requirements files
+        cache_dir (string, optional): directory for parsed files
+
+    Raises
+    ------
+        ParseError: if a file is not found, cannot be parsed
+            or includes itself
+
+    Returns
+    -------
+        RequirementSet: merged packages, constraint files and
+            all requirements files read
+
+    """
+    packages = []
+    constraints = []
+    files = []
+    stack = []
+
+    def read(path):
+        if path in stack:
+            raise ParseError("Include cycle found: {}".format(
+                " -> ".join(stack[stack.index(path):] + [path])))
+        if path in files:
+            return
+        if not os.path.isfile(path):
+            raise ParseError("Cannot find requirements file: {}".format(
+                path))
+        stack.append(path)
+        files.append(path)
+        for kind, value in parse_file(path, cache_dir):
+            if kind == "package":
+                packages.append(value)
+                continue
+            include = os.path.abspath(
+                os.path.join(os.path.dirname(path), value))
+            if kind == "requirement":
+                read(include)
+            elif include not in constraints:
+                if not os.path.isfile(include):
+                    raise ParseError(
+                        "Cannot find constraints file: {}".format(include))
+                constraints.append(include)
+        stack.pop()
+
+    for path in path_list:
+        read(os.path.abspath(path))
+    return RequirementSet(packages, constraints, files)
+
+
+def use_token(package):
+    """Check if package is cloned using a token.
+
+    Args:
+        package (Requirement): package parsed from requirements.txt
+
+    Returns
+    -------
+        Bool: package is a git package installed from url
+
+    """
+    return bool(package.url and not package.using_line)
+
+
+def get_requirement(package):
+    """Return package as a PEP 508 requirement.
+
+    Args:
+        package (Requirement): package parsed from requirements.txt
+
+    Returns
+    -------
+        packaging.requirements.Requirement: requirement or None
+            for packages with options, urls or which cannot be parsed
+
+    """
+    if package.option or use_token(package):
+        return None
+    try:
+        requirement = packaging.requirements.Requirement(
+            package.line if package.using_line else
+            package.name + package.specifier
+        )
+    except (packaging.requirements.InvalidRequirement, InvalidSpecifier):
+        return None
+    return requirement if not requirement.url else None
+
+
+def evaluate_markers(package_list, environment=None):
+    """Evaluate PEP 508 markers for running interpreter.
+
+    Packages which markers do not apply are removed. Packages which
+    markers apply are parsed again without the marker, to be
+    installed like any other requirement. Lines which cannot be
+    parsed as requirements are kept, to let pip decide.
+
+    Args:
+        package_list (list): Data parsed from requirements files
+        environment (dict, optional): marker values to override
+
+    Returns
+    -------
+        List: packages which apply to running interpreter
+
+    """
+    evaluated_list = []
+    for package in package_list:
+        requirement = get_requirement(package)
+        if requirement and requirement.marker:
+            if not requirement.marker.evaluate(environment):
+                continue
+            requirement.marker = None
+            package = parse_line(str(requirement)).replace(
+                hashes=package.hashes)
+        evaluated_list.append(package)
+    return evaluated_list
+
+
+def _get_pins(specifier):
+    """Return pinned versions, compared as PEP 440 versions.
+
+    ``==2.0`` and ``==2.0.0`` are the same pin. Arbitrary
+    equality (``===``) pins are compared as strings.
+    """
+    pins = set()
+    for spec in specifier:
+        if spec.operator not in ("==", "===") or "*" in spec.version:
+            continue
+        try:
+            pins.add(
+                Version(spec.version) if spec.operator == "==" else
+                spec.version)
+        except InvalidVersion:
+            pins.add(spec.version)
+    return pins
+
+
+def _merge_requirements(requirement_list):
+    """Merge extras and specifiers from requirements.
+
+    Returns
+    -------
+        packaging.requirements.Requirement: merged requirement or
+            None if there is no version which satisfy all of them
+
+    """
+    merged = packaging.requirements.Requirement(str(requirement_list[0]))
+    for requirement in requirement_list[1:]:
+        merged.extras |= requirement.extras
+        merged.specifier &= requirement.specifier
+    pins = _get_pins(merged.specifier)
+    if len(pins) > 1:
+        return None
+    for pin in pins:
+        if not merged.specifier.contains(pin, prereleases=True):
+            return None
+    # Older packaging versions keep ``==2.0`` and ``==2.0.0``
+    # side by side, so keep only the first spec of each pin.
+    specs = []
+    kept = set()
+    for requirement in requirement_list:
+        for spec in sorted(requirement.specifier, key=str):
+            pin = _get_pins(SpecifierSet(str(spec)))
+            if str(spec) in specs or pin & kept:
+                continue
+            kept |= pin
+            specs.append(str(spec))
+    merged.specifier = SpecifierSet(",".join(specs))
+    return merged
+
+
+def _get_key(package, requirement):
+    if requirement and not requirement.marker:
+        name = canonicalize_name(requirement.name)
+        return ("pip", name), name
+    if use_token(package):
+        return ("git", package.url), package.key
+    return ("line", package.option, package.line or
+            package.name), None
+
+
+def _get_values(group, field):
+    values = []
+    for package, _ in group:
+        value = getattr(package, field)
+        if value not in values:
+            values.append(value)
+    return values
+
+
+def merge_packages(package_list):
+    """Merge packages found in many requirements files.
+
+    Names are normalized (PEP 503). Requirements for the same
+    project are merged in one, with all extras, specifiers and
+    hashes, in the position of the first one. Git packages from
+    the same url and head, and identical lines, are installed once.
+
+    These are conflicts:
+
+    * Pinned versions which do not satisfy other specifiers
+    * Same git url with different heads or options (ex.: "-e")
+    * Same project installed from different git urls, or from
+      git and from package index
+
+    Requirements with markers are not merged.
+
+    Args:
+        package_list (list): Data parsed from requirements files
+
+    Returns
+    -------
+        Tuple: merged packages and conflict messages
+
+    """
+    groups = OrderedDict()
+    sources = {}
+    conflicts = []
+    for package in package_list:
+        requirement = get_requirement(package)
+        key, name = _get_key(package, requirement)
+        source = sources.setdefault(name, key) if name else key
+        if source != key:
+            message = "Conflicting sources for {}: {} and {}".format(
+                name,
+                source[1] if source[0] == "git" else "package index",
+                key[1] if key[0] == "git" else "package index")
+            if message not in conflicts:
+                conflicts.append(message)
+            continue
+        groups.setdefault(key, []).append((package, requirement))
+
+    merged_list = []
+    for key, group in groups.items():
+        package, requirement = group[0]
+        if key[0] == "git":
+            heads = _get_values(group, "head")
+            if len(heads) > 1:
+                conflicts.append(
+                    "Conflicting heads for {}: {}".format(
+                        key[1],
+                        ", ".join(head or "HEAD" for head in heads)))
+            options = _get_values(group, "option")
+            if len(options) > 1:
+                conflicts.append(
+                    "Conflicting options for {}: {}".format(
+                        key[1],
+                        ", ".join(option or "none" for option in options)))
+        elif key[0] == "pip" and len(group) > 1:
+            requirement_list = [item for _, item in group]
+            merged = _merge_requirements(requirement_list)
+            if not merged:
+                conflicts.append(
+                    "Conflicting requirements for {}: {}".format(
+                        key[1],
+                        ", ".join(str(item) for item in requirement_list)))
+            elif any(str(item) != str(merged) for item in requirement_list):
+                package = Requirement.create(
+                    name="{}{}".format(
+                        merged.name,
+                        "[{}]".format(",".join(sorted(merged.extras)))
+                        if merged.extras else ""
+                    ),
+                    line=str(merged),
+                    using_line=True
+                )
+            hashes = []
+            for item, _ in group:
+                for value in item.hashes.split():
+                    if value not in hashes:
+                        hashes.append(value)
+            package = package.replace(hashes=" ".join(hashes))
+        merged_list.append(package)
+    return merged_list, conflicts
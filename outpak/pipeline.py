@@ -0,0 +1,168 @@
+"""Install pipeline module."""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from buzio import console
+
+
+class Pipeline():
+    """Install packages using an asyncio pipeline.
+
+    Each package which need a token clone passes by three
+    stages: fetch (clone or cached wheel), build (wheel) and
+    install. Fetch and build stages run in parallel, each one
+    with its own limit, so one package is build while the next
+    is still downloading. Install stage runs one package at a
+    time, in the same order of requirements files.
+
+    If any stage fails, all pending stages are cancelled as soon
+    as the failure is found, and no other package is installed.
+
+    Attributes
+    ----------
+        build_jobs (int): number of parallel builds
+        fetch_jobs (int): number of parallel fetches
+        outpak (Outpak): Outpak instance
+
+    """
+
+    def __init__(self, outpak, fetch_jobs=1, build_jobs=1):
+        """Initialize class.
+
+        Args:
+            outpak (Outpak): Outpak instance
+            fetch_jobs (int, optional): number of parallel fetches
+            build_jobs (int, optional): number of parallel builds
+        """
+        self.outpak = outpak
+        self.fetch_jobs = fetch_jobs
+        self.build_jobs = build_jobs
+
+    def run(self, package_list, batch=False):
+        """Run pipeline.
+
+        Args:
+            package_list (list): Data parsed from requirements.txt
+            batch (bool, optional): install packages which do not
+                need a token clone in a single pip transaction
+        """
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(
+            max_workers=self.fetch_jobs + self.build_jobs + 1)
+        loop.set_default_executor(executor)
+        try:
+            loop.run_until_complete(self._run(loop, package_list, batch))
+        finally:
+            executor.shutdown(wait=True)
+            loop.close()
+
+    async def _call(self, loop, semaphore, function, *args):
+        async with semaphore:
+            return await loop.run_in_executor(None, function, *args)
+
+    async def _prepare(self, loop, semaphores, package):
+        """Run fetch and build stages for package.
+
+        Returns
+        -------
+            Tuple: source from build stage (or None if failed)
+                and buffered output
+
+        """
+        output = []
+        fetch_semaphore, build_semaphore = semaphores
+        source = await self._call(
+            loop, fetch_semaphore, self.outpak.fetch_package,
+            package, output)
+        if source:
+            source = await self._call(
+                loop, build_semaphore, self.outpak.build_package,
+                package, source, output)
+        return source, output
+
+    def _watch(self, failure, package):
+        """Return callback which sets failure if prepare task fails."""
+        def callback(task):
+            if task.cancelled() or failure.done():
+                return
+            if task.exception():
+                failure.set_exception(task.exception())
+            elif not task.result()[0]:
+                failure.set_result((package, task.result()[1]))
+        return callback
+
+    def _abort(self, failure):
+        package, output = failure.result()
+        self.outpak._flush_output(output)
+        console.error(
+            "Cannot fetch {}. Task aborted.".format(package.name))
+        sys.exit(1)
+
+    async def _wait(self, future, failure):
+        """Wait for future, unless a prepare task fails first."""
+        await asyncio.wait(
+            [future, failure], return_when=asyncio.FIRST_COMPLETED)
+        if failure.done():
+            self._abort(failure)
+
+    async def _run(self, loop, package_list, batch):
+        semaphores = (
+            asyncio.Semaphore(self.fetch_jobs),
+            asyncio.Semaphore(self.build_jobs)
+        )
+        # Packages with same name share the clone dir, so
+        # only the first one is fetched before its install.
+        names = set()
+        tasks = []
+        failure = loop.create_future()
+        for package in package_list:
+            task = None
+            if self.outpak._use_token(package) and \
+                    package.name not in names:
+                names.add(package.name)
+                task = loop.create_task(
+                    self._prepare(loop, semaphores, package))
+                task.add_done_callback(self._watch(failure, package))
+            tasks.append(task)
+        try:
+            if batch:
+                pip_packages = [
+                    package
+                    for package in package_list
+                    if not self.outpak._use_token(package)
+                ]
+                if pip_packages:
+                    future = loop.run_in_executor(
+                        None, self.outpak.install_batch, pip_packages)
+                    await self._wait(future, failure)
+                    future.result()
+            for package, task in zip(package_list, tasks):
+                use_token = self.outpak._use_token(package)
+                if batch and not use_token:
+                    continue
+                source = None
+                if use_token:
+                    if not task:
+                        task = loop.create_task(
+                            self._prepare(loop, semaphores, package))
+                        task.add_done_callback(
+                            self._watch(failure, package))
+                        tasks.append(task)  # cancelled on exit
+                    await self._wait(task, failure)
+                    source, output = task.result()
+                    self.outpak._flush_output(output)
+                    if not source:
+                        console.error(
+                            "Cannot fetch {}. Task aborted.".format(
+                                package.name))
+                        sys.exit(1)
+                elif failure.done():
+                    self._abort(failure)
+                await loop.run_in_executor(
+                    None, self.outpak.install_package, package, source)
+        finally:
+            pending = [task for task in tasks if task and not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
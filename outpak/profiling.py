@@ -0,0 +1,135 @@
+"""Profiling module.
+
+Profilers are imported only when used, so they do not slow down
+normal runs.
+"""
+import linecache
+import os
+import sys
+import threading
+
+
+def format_memory_report(snapshot, peak, limit=20):
+    """Return largest allocations in tracemalloc snapshot.
+
+    Allocations made by import machinery and by tracemalloc
+    itself are ignored.
+
+    Args:
+        snapshot (Snapshot): tracemalloc snapshot
+        peak (int): peak traced memory, in bytes
+        limit (int, optional): number of lines in report
+
+    Returns
+    -------
+        List: report lines
+
+    """
+    import tracemalloc
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ])
+    statistics = snapshot.statistics("lineno")
+    lines = [
+        "Peak memory: {:.1f} KiB".format(peak / 1024),
+        "{:>10}  {:>8}  {}".format("KiB", "Blocks", "Line")
+    ]
+    for stat in statistics[:limit]:
+        frame = stat.traceback[0]
+        lines.append("{:>10.1f}  {:>8}  {}:{}  {}".format(
+            stat.size / 1024,
+            stat.count,
+            os.path.relpath(frame.filename)
+            if frame.filename.startswith(os.getcwd()) else frame.filename,
+            frame.lineno,
+            linecache.getline(frame.filename, frame.lineno).strip()
+        ))
+    other = statistics[limit:]
+    if other:
+        lines.append("{:>10.1f}  {:>8}  {} other lines".format(
+            sum(stat.size for stat in other) / 1024,
+            sum(stat.count for stat in other),
+            len(other)
+        ))
+    return lines
+
+
+def _start_thread_profiler(profilers):
+    """Return function which profiles each new thread.
+
+    The function is set with ``threading.setprofile``, so it is
+    called once in each new thread, where it enables a new
+    profiler, which replaces it as profile function.
+    """
+    import cProfile
+
+    def start(*args):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Profiler for main thread already sees all threads
+            sys.setprofile(None)
+            return
+        profilers.append(profiler)
+    return start
+
+
+def run_with_profilers(function, profile_path=None, trace_memory=False,
+                       limit=20):
+    """Run function with cProfile and tracemalloc.
+
+    Threads started by function (like fetch, build and install
+    workers) are profiled too, and their stats are merged with
+    stats for main thread. Results are saved (or printed) even if
+    function exits with ``sys.exit``.
+
+    Args:
+        function (callable): function to run, without arguments
+        profile_path (string, optional): path for pstats file
+        trace_memory (bool, optional): print largest allocations
+        limit (int, optional): number of lines in memory report
+
+    Returns
+    -------
+        Any: value returned by function
+
+    """
+    from buzio import console
+    profiler = None
+    snapshot = None
+    thread_profilers = []
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        threading.setprofile(_start_thread_profiler(thread_profilers))
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        return function()
+    finally:
+        if profiler:
+            threading.setprofile(None)
+            profiler.disable()
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        if profiler:
+            import pstats
+            stats = pstats.Stats(profiler)
+            for thread_profiler in thread_profilers:
+                stats.add(thread_profiler)
+            stats.dump_stats(profile_path)
+            console.info(
+                "Profile saved in {0}. "
+                "Read it with: python -m pstats {0}".format(profile_path))
+        if snapshot:
+            console.section("Memory")
+            for line in format_memory_report(snapshot, peak, limit):
+                console.info(line, use_prefix=False)
@@ -0,0 +1,214 @@
+"""Git refs resolution module."""
+import json
+import os
+import re
+import threading
+import time
+
+
+def is_commit(ref):
+    """Check if ref is a full commit.
+
+    Args:
+        ref (string): git ref
+
+    Returns
+    -------
+        Bool: ref is a full commit
+
+    """
+    return bool(ref and re.match(r"^[0-9a-f]{40}$", ref))
+
+
+class RefResolver():
+    """Resolve git refs to commits using ``git ls-remote``.
+
+    Resolved refs are saved in a json file. Branches (and the
+    remote HEAD) are saved for ``ttl`` seconds. Tags are saved
+    permanently, because they do not move.
+
+    Cache hits and misses are counted once for each url and ref,
+    even if the same ref is resolved many times.
+
+    Attributes
+    ----------
+        cache (dict): resolved refs for each url and ref
+        hits (int): refs found in cache
+        misses (int): refs not found in cache
+        path (string): full path for cache file
+        run_command (callable): function to run commands
+        ttl (int): seconds to keep branches in cache
+
+    """
+
+    def __init__(self, path, run_command, ttl=300):
+        """Initialize class.
+
+        Args:
+            path (string): full path for cache file
+            run_command (callable): function to run commands,
+                with the same signature of Outpak._run_command
+            ttl (int, optional): seconds to keep branches in cache
+        """
+        self.path = path
+        self.run_command = run_command
+        self.ttl = ttl
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self._counted = set()
+        self._lock = threading.Lock()
+        self._changed = False
+        self.load()
+
+    def load(self):
+        """Load resolved refs from cache file."""
+        try:
+            with open(self.path) as file:
+                self.cache = json.load(file)
+        except (IOError, OSError, ValueError):
+            self.cache = {}
+
+    def save(self):
+        """Save resolved refs in cache file."""
+        if not self._changed:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            temp_path = "{}.{}".format(self.path, os.getpid())
+            with open(temp_path, "w") as file:
+                json.dump(self.cache, file, indent=2, sort_keys=True)
+            os.rename(temp_path, self.path)
+            self._changed = False
+
+    def _get_key(self, url, ref):
+        return "{}@{}".format(url, ref) if ref else url
+
+    def _get_cached(self, key):
+        with self._lock:
+            data = self.cache.get(key)
+        if not data:
+            return None
+        if data.get('permanent') or time.time() - data['time'] < self.ttl:
+            return data['commit']
+        return None
+
+    def _count(self, key, hit):
+        with self._lock:
+            if key in self._counted:
+                return
+            self._counted.add(key)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _ls_remote(self, remote, ref, name=None):
+        """Run ``git ls-remote`` for ref.
+
+        Args:
+            remote (string): remote url, with credentials
+            ref (string): branch, tag or None for remote HEAD
+            name (string, optional): name used in timings
+
+        Returns
+        -------
+            Tuple: commit and if ref is a tag, or (None, False)
+
+        """
+        refs = self.run_command(
+            ["git", "ls-remote", remote, ref if ref else "HEAD"],
+            get_stdout=True,
+            span=("resolve", name or remote)
+        )
+        commits = {}
+        for line in (refs or "").splitlines():
+            if "\t" in line:
+                commit, name = line.split("\t", 1)
+                commits[name.strip()] = commit.strip()
+        if not ref:
+            return commits.get("HEAD"), False
+        candidates = [
+            ("refs/tags/{}^{{}}".format(ref), True),
+            ("refs/tags/{}".format(ref), True),
+            ("refs/heads/{}".format(ref), False),
+            (ref, ref.startswith("refs/tags/"))
+        ]
+        for name, is_tag in candidates:
+            if name in commits:
+                return commits[name], is_tag
+        return None, False
+
+    def resolve(self, url, remote, ref):
+        """Resolve ref to a full commit.
+
+        Full commits are returned as is. Abbreviated commits
+        cannot be resolved without clone.
+
+        Args:
+            url (string): repository url, without credentials
+            remote (string): repository url, with credentials
+            ref (string): branch, tag, commit or None for remote HEAD
+
+        Returns
+        -------
+            String: full commit or None if cannot be resolved
+
+        """
+        if is_commit(ref):
+            return ref
+        key = self._get_key(url, ref)
+        commit = self._get_cached(key)
+        self._count(key, bool(commit))
+        if commit:
+            return commit
+        commit, is_tag = self._ls_remote(remote, ref, key)
+        if commit:
+            with self._lock:
+                self.cache[key] = {
+                    'commit': commit,
+                    'time': time.time(),
+                    'permanent': is_tag
+                }
+                self._changed = True
+        return commit
+
+    def resolve_many(self, ref_list, jobs=1):
+        """Resolve refs concurrently.
+
+        Args:
+            ref_list (list): tuples with url, remote and ref
+            jobs (int, optional): number of parallel ls-remote
+
+        Returns
+        -------
+            Dict: commit (or None) for each url and ref
+
+        """
+        commits = {}
+        pending = []
+        for url, remote, ref in ref_list:
+            key = self._get_key(url, ref)
+            if key in commits:
+                continue
+            if is_commit(ref):
+                commits[key] = ref
+                continue
+            commits[key] = self._get_cached(key)
+            if commits[key]:
+                self._count(key, True)
+            else:
+                pending.append((key, url, remote, ref))
+        if pending:
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {
+                    executor.submit(self.resolve, url, remote, ref): key
+                    for key, url, remote, ref in pending
+                }
+                for future in as_completed(futures):
+                    commits[futures[future]] = future.result()
+        self.save()
+        return commits
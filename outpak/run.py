@@ -1,7 +1,16 @@
 """Outpak.
 
 Usage:
-  pak install [--config=<path>]
+  pak install [--config=<path>] [--batch] [--jobs=<n>] [--force]
+              [--prefetch] [--from-bundle=<path>]
+              [--timings] [--trace=<path>]
+              [--profile=<path>] [--trace-memory]
+              [--metrics=<path>] [--metrics-json=<path>]
+  pak lock [--config=<path>] [--jobs=<n>] [--timings] [--trace=<path>]
+           [--profile=<path>] [--trace-memory]
+  pak bundle [--config=<path>] [--jobs=<n>] [--output=<path>]
+             [--timings] [--trace=<path>]
+             [--profile=<path>] [--trace-memory]
   pak -h | --help
   pak --version
 
@@ -9,12 +18,23 @@ Options:
   -h --help         Show this screen.
   --version         Show version.
   --config=<path>  Full path for pak.yml
+  --batch           Install pip packages in a single transaction
+  --jobs=<n>        Number of packages to clone or resolve in parallel
+  --force           Ignore stamp and install all packages
+  --prefetch        Download wheels in parallel, then install offline
+  --from-bundle=<path>  Install only the wheels in bundle file
+  --output=<path>   Full path for bundle file
+  --timings         Show time spent in each phase for each package
+  --trace=<path>    Save timings in a Chrome trace event file
+  --profile=<path>  Save cProfile stats for Outpak in file
+  --trace-memory    Show largest memory allocations made by Outpak
+  --metrics=<path>  Save install metrics in OpenMetrics textfile
+  --metrics-json=<path>  Save install metrics in JSON file
 """
 import os
+from functools import partial
 from docopt import docopt
 from outpak import __version__
-from buzio import console
-from outpak.main import Outpak
 
 
 def get_path():
@@ -43,10 +63,17 @@ def get_from_env():
 
 
 def run():
-    """Run main command for outpak."""
-    console.box("Outpak v{}".format(__version__))
+    """Run main command for outpak.
+
+    Modules are imported after parse arguments, so ``--version``
+    and ``--help`` do not wait for them.
+    """
     arguments = docopt(__doc__, version=__version__)
 
+    from buzio import console
+    from outpak.main import Outpak
+    console.box("Outpak v{}".format(__version__))
+
     path = None
     if arguments['--config']:
         path = arguments['--config']
@@ -58,8 +85,49 @@ def run():
         path = get_path()
 
     if arguments['install']:
-        newpak = Outpak(path)
-        newpak.run()
+        newpak = Outpak(
+            path,
+            batch=arguments.get('--batch') or None,
+            jobs=arguments.get('--jobs'),
+            force=arguments.get('--force') or None,
+            prefetch=arguments.get('--prefetch') or None,
+            timings=arguments.get('--timings') or None,
+            trace=arguments.get('--trace'),
+            metrics_file=arguments.get('--metrics'),
+            metrics_json=arguments.get('--metrics-json')
+        )
+        command = newpak.run
+        if arguments.get('--from-bundle'):
+            command = partial(
+                newpak.install_bundle, arguments['--from-bundle'])
+
+    if arguments.get('lock'):
+        newpak = Outpak(
+            path,
+            jobs=arguments.get('--jobs'),
+            timings=arguments.get('--timings') or None,
+            trace=arguments.get('--trace')
+        )
+        command = newpak.lock
+
+    if arguments.get('bundle'):
+        newpak = Outpak(
+            path,
+            jobs=arguments.get('--jobs'),
+            timings=arguments.get('--timings') or None,
+            trace=arguments.get('--trace')
+        )
+        command = partial(newpak.bundle, arguments.get('--output'))
+
+    if arguments.get('--profile') or arguments.get('--trace-memory'):
+        from outpak.profiling import run_with_profilers
+        run_with_profilers(
+            command,
+            profile_path=arguments.get('--profile'),
+            trace_memory=arguments.get('--trace-memory')
+        )
+    else:
+        command()
 
 
 if __name__ == "__main__":
@@ -6,14 +6,36 @@ Attributes
     REQ (Str): requirements.txt model
 
 """
+import io
+import json
 import unittest
 import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from outpak.archive import (COMMIT_FILE, ArchiveError, download, extract,
+                            get_archive_url)
+from outpak.command import CommandResult, run_command
+from outpak.installed import Distribution, get_installed_commit
+from outpak.metrics import Metrics
+from outpak.parser import (ParseError, evaluate_markers, iter_lines,
+                           merge_packages, parse_file, parse_line,
+                           parse_lines, read_requirements)
 from outpak.main import Outpak
+from outpak.pipeline import Pipeline
+from outpak.profiling import run_with_profilers
+from outpak.refs import RefResolver
+from outpak.timings import Timings
+from outpak.wheelhouse import Wheelhouse
 
 try:
-    from unittest.mock import patch
+    from unittest.mock import Mock, patch
 except ImportError:
-    from mock import patch
+    from mock import Mock, patch
 
 PAK = """
 version: "1"
@@ -39,10 +61,10 @@ REQ = """
 
 -r requirements_test.txt
 SomeProject
-SomeProject == 1.3
+SomeProject0 == 1.3
 SomeProject >=1.2,<.2.0
 SomeProject[foo, bar]
-SomeProject~=1.4.2
+SomeProject1~=1.4.2
 SomeProject ==5.4 ; python_version < '2.7'
 SomeProject; sys_platform == 'win32'
 SomeProject[foo]>=2.18.1  # another comment
@@ -60,11 +82,11 @@ git+https://git.myproject.org/MyProject#egg=MyProject
 git+ssh://git.myproject.org/MyProject#egg=MyProject
 git+git://git.myproject.org/MyProject#egg=MyProject
 git+file://git.myproject.org/MyProject#egg=MyProject
--e git+git@git.myproject.org:MyProject#egg=MyProject
+-e git+git@git.myproject.org:MyEditable#egg=MyEditable
 
-git://git.myproject.org/MyProject.git@master#egg=MyProject
-git://git.myproject.org/MyProject.git@v1.0#egg=MyProject
-git://git.myproject.org/MyProject.git@da39a3ee5e6b4b0d3255bfef95601890afd80709#egg=MyProject
+git://git.myproject.org/MyBranch.git@master#egg=MyBranch
+git://git.myproject.org/MyTag.git@v1.0#egg=MyTag
+git://git.myproject.org/MyCommit.git@da39a3ee5e6b4b0d3255bfef95601890afd80709#egg=MyCommit
 
 hg+http://hg.myproject.org/MyProject#egg=MyProject
 hg+https://hg.myproject.org/MyProject#egg=MyProject
@@ -112,7 +134,7 @@ class TestOutpakRunModule(unittest.TestCase):
             '/tmp/pak.yml'
         )
 
-    @patch("outpak.run.Outpak", autospec=True)
+    @patch("outpak.main.Outpak", autospec=True)
     @patch(
         "outpak.run.docopt",
         autospec=True,
@@ -126,6 +148,618 @@ class TestOutpakRunModule(unittest.TestCase):
         from outpak.run import run
         self.assertIsNone(run())
 
+    def test_lazy_imports(self):
+        """test_lazy_imports."""
+        for module, lazy_list in [
+                ("outpak.run", ["yaml", "buzio", "outpak.main", "asyncio"]),
+                ("outpak.main", ["yaml", "asyncio", "outpak.pipeline",
+                                 "outpak.installed"])]:
+            loaded = subprocess.check_output([
+                sys.executable, "-c",
+                "import sys, {}; print(' '.join(sys.modules))".format(module)
+            ]).decode('utf-8').split()
+            self.assertEqual(
+                [name for name in lazy_list if name in loaded], [])
+
+
+class TestRunCommand(unittest.TestCase):
+    """Command module tests."""
+
+    def test_run_command(self):
+        """test_run_command."""
+        lines = []
+        result = run_command(
+            [sys.executable, "-c", "for i in range(100): print(i)"],
+            cwd="/tmp",
+            callback=lines.append,
+            tail=10
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(result.output.splitlines(), lines[-10:])
+        self.assertIsNone(result.stdout)
+        self.assertGreater(result.duration, 0)
+
+    def test_run_command_capture(self):
+        """test_run_command_capture."""
+        result = run_command(["pwd"], cwd="/tmp", capture=True)
+        self.assertEqual(result.stdout.strip(), os.path.realpath("/tmp"))
+
+    def test_run_command_not_found(self):
+        """test_run_command_not_found."""
+        result = run_command(["outpak-command-not-found"])
+        self.assertEqual(result.returncode, 127)
+
+
+class TestParser(unittest.TestCase):
+    """Parser module tests."""
+
+    def test_iter_lines(self):
+        """test_iter_lines."""
+        lines = [
+            "# comment\n",
+            "\n",
+            "-r other.txt\n",
+            "django==2.0.0\n",
+            "-e \\\n",
+            "    git+https://github.com/my/pack@v1#egg=pack\n",
+            "requests==2.18.4 \\\n",
+            "    --hash=sha256:abcd\n",
+        ]
+        self.assertEqual(
+            list(iter_lines(lines)),
+            [
+                "-r other.txt",
+                "django==2.0.0",
+                "-e git+https://github.com/my/pack@v1#egg=pack",
+                "requests==2.18.4 --hash=sha256:abcd"
+            ]
+        )
+
+    def test_parse_lines(self):
+        """test_parse_lines."""
+        package_list = parse_lines([
+            "django[bcrypt]",
+            "requests==2.18.4 --hash=sha256:abcd",
+            "-e git+git@github.com:my/pack.git@v1#egg=pack\n",
+            "https://example.org/pack@1234#egg=pack",
+        ])
+        self.assertEqual(package_list[0].name, "django[bcrypt]")
+        self.assertEqual(package_list[1].version, "2.18.4")
+        self.assertEqual(package_list[1].hashes, "--hash=sha256:abcd")
+        self.assertEqual(package_list[2].url, "github.com/my/pack")
+        self.assertEqual(package_list[2].head, "v1")
+        self.assertEqual(package_list[2].egg, "pack")
+        self.assertEqual(
+            package_list[3].line, "https://example.org/pack@1234")
+
+    def test_requirement(self):
+        """test_requirement."""
+        line = "-e git+git@github.com:my/My_Pack@v1#egg=My.Pack"
+        requirement = parse_line(line)
+        self.assertEqual(requirement.key, "my-pack")
+        self.assertEqual(requirement.vcs, "git")
+        self.assertEqual(requirement.head, "v1")
+        self.assertEqual({requirement, parse_line(line)}, {requirement})
+        with self.assertRaises(AttributeError):
+            requirement.head = "v2"
+        self.assertEqual(requirement.replace(head="v2").head, "v2")
+        requirement = parse_line("Django[bcrypt] >= 2.0")
+        self.assertEqual(requirement.key, "django")
+        self.assertEqual(requirement.specifier, ">=2.0")
+        self.assertEqual(
+            requirement.argv, ("pip", "install", "Django[bcrypt]>=2.0"))
+        self.assertEqual(
+            requirement.replace(version="2.1").argv,
+            ("pip", "install", "Django[bcrypt]>=2.1"))
+        self.assertIsNone(parse_line("./packages/my_package").key)
+
+    def test_parse_error(self):
+        """test_parse_error."""
+        for line in ["-r other.txt", "--index-url https://example.org"]:
+            with self.assertRaises(ParseError):
+                parse_line(line)
+
+    def test_evaluate_markers(self):
+        """test_evaluate_markers."""
+        package_list = evaluate_markers(
+            parse_lines([
+                "SomeProject ==5.4 ; python_version < '2.7'",
+                "SomeProject; sys_platform == 'win32'",
+                "requests[security]>=2.0 ; python_version >= '3'",
+                "colorama; sys_platform == 'linux'",
+                "pywin32==1.0 ; sys_platform == 'win32'  # windows only",
+                "pyinotify==0.9 ; sys_platform == 'linux'  # linux only",
+            ]),
+            environment={'python_version': '3.6', 'sys_platform': 'linux'}
+        )
+        self.assertEqual(
+            [package.name for package in package_list],
+            ["requests[security]", "colorama", "pyinotify"]
+        )
+        self.assertEqual(package_list[0].version, "2.0")
+        self.assertFalse(package_list[0].using_line)
+        self.assertEqual(package_list[1].line, "colorama")
+        self.assertEqual(package_list[2].version, "0.9")
+
+    def test_merge_packages(self):
+        """test_merge_packages."""
+        package_list, conflicts = merge_packages(parse_lines([
+            "requests>=2.0",
+            "django==2.0.0",
+            "Requests[security]",
+            "-e git+https://github.com/my/pack@v1#egg=pack",
+            "requests<3",
+            "django==2.0.0",
+            "-e git+https://github.com/my/pack@v1#egg=pack",
+            "six==1.0 --hash=sha256:abcd",
+            "six==1.0.0 --hash=sha256:abcd --hash=sha256:ef01",
+            "pyjwt>=1.0",
+            "PyJWT[crypto]<3",
+        ]))
+        self.assertEqual(conflicts, [])
+        self.assertEqual(len(package_list), 5)
+        self.assertEqual(package_list[0].name, "requests[security]")
+        self.assertEqual(package_list[0].line, "requests[security]<3,>=2.0")
+        self.assertEqual(package_list[1].version, "2.0.0")
+        self.assertEqual(package_list[3].line, "six==1.0")
+        self.assertEqual(
+            package_list[3].hashes, "--hash=sha256:abcd --hash=sha256:ef01")
+        self.assertEqual(package_list[4].line, "pyjwt[crypto]<3,>=1.0")
+
+    def test_merge_packages_conflicts(self):
+        """test_merge_packages_conflicts."""
+        _, conflicts = merge_packages(parse_lines([
+            "requests==2.18.0",
+            "requests>=2.19",
+            "-e git+https://github.com/my/pack@v1#egg=pack",
+            "-e git+https://github.com/my/pack@v2#egg=pack",
+            "-e git+https://github.com/my/django@v1#egg=django",
+            "django",
+            "git+https://github.com/my/other@v1#egg=other",
+            "-e git+https://github.com/my/other@v1#egg=other",
+        ]))
+        self.assertEqual(conflicts, [
+            "Conflicting sources for django: github.com/my/django "
+            "and package index",
+            "Conflicting requirements for requests: "
+            "requests==2.18.0, requests>=2.19",
+            "Conflicting heads for github.com/my/pack: v1, v2",
+            "Conflicting options for github.com/my/other: none, -e",
+        ])
+
+    def _write_files(self, files):
+        self.path = "/tmp/outpak-requirements"
+        os.makedirs(os.path.join(self.path, "requirements"))
+        for name, lines in files.items():
+            with open(os.path.join(self.path, name), "w") as file:
+                file.write("\n".join(lines))
+
+    def tearDown(self):
+        """tearDown."""
+        if os.path.exists("/tmp/outpak-requirements"):
+            shutil.rmtree("/tmp/outpak-requirements")
+
+    def test_read_requirements(self):
+        """test_read_requirements."""
+        self._write_files({
+            "requirements/base.txt": ["django==2.0.0", "-c constraints.txt"],
+            "requirements/constraints.txt": ["requests<3"],
+            "requirements/prod.txt": ["-r base.txt", "gunicorn"],
+            "requirements/test.txt": ["--requirement=base.txt", "pytest"],
+            "requirements.txt": [
+                "-r requirements/prod.txt", "-r requirements/test.txt"],
+        })
+        requirement_set = read_requirements(
+            [os.path.join(self.path, "requirements.txt")])
+        self.assertEqual(
+            [package.name for package in requirement_set.packages],
+            ["django", "gunicorn", "pytest"]
+        )
+        self.assertEqual(
+            requirement_set.constraints,
+            [os.path.join(self.path, "requirements/constraints.txt")]
+        )
+        self.assertEqual(len(requirement_set.files), 4)
+
+    def test_parse_file_cache(self):
+        """test_parse_file_cache."""
+        self._write_files({
+            "requirements.txt": [
+                "-r requirements/base.txt",
+                "-e git+https://github.com/my/pack@v1#egg=pack",
+                "Django>=2.0"
+            ],
+        })
+        path = os.path.join(self.path, "requirements.txt")
+        cache_dir = os.path.join(self.path, "cache")
+        entries = parse_file(path, cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        with patch("outpak.parser._file_cache", {}), \
+                patch("outpak.parser.parse_line", side_effect=ValueError), \
+                patch("outpak.parser.Requirement.create",
+                      side_effect=ValueError), \
+                patch("outpak.parser.canonicalize_name",
+                      side_effect=ValueError):
+            cached = parse_file(path, cache_dir)
+        self.assertEqual(cached, entries)
+        self.assertEqual(hash(cached[1][1]), hash(entries[1][1]))
+        with open(path, "a") as file:
+            file.write("\nrequests\n")
+        with patch("outpak.parser._file_cache", {}):
+            self.assertEqual(len(parse_file(path, cache_dir)), 4)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_read_requirements_cycle(self):
+        """test_read_requirements_cycle."""
+        self._write_files({
+            "requirements/base.txt": ["-r ../requirements.txt"],
+            "requirements.txt": ["django", "-r requirements/base.txt"],
+        })
+        with self.assertRaises(ParseError) as context:
+            read_requirements([os.path.join(self.path, "requirements.txt")])
+        self.assertIn("cycle", str(context.exception))
+
+
+class TestRefResolver(unittest.TestCase):
+    """RefResolver class Tests."""
+
+    def setUp(self):
+        """setUp."""
+        super(TestRefResolver, self).setUp()
+        self.path = "/tmp/outpak-refs.json"
+        self.commit = "da39a3ee5e6b4b0d3255bfef95601890afd80709"
+        self.run_command = Mock(return_value=(
+            "{0}\trefs/heads/master\n"
+            "{0}\trefs/tags/v1.0\n".format(self.commit)
+        ))
+
+    def tearDown(self):
+        """tearDown."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_resolve_with_cache(self):
+        """test_resolve_with_cache."""
+        resolver = RefResolver(self.path, self.run_command)
+        commits = resolver.resolve_many(
+            [
+                ("github.com/my/pack", "https://token@github.com/my/pack",
+                 "master"),
+                ("github.com/my/pack", "https://token@github.com/my/pack",
+                 "v1.0"),
+                ("github.com/my/pack", "https://token@github.com/my/pack",
+                 self.commit),
+            ],
+            jobs=2
+        )
+        self.assertEqual(
+            commits,
+            {
+                "github.com/my/pack@master": self.commit,
+                "github.com/my/pack@v1.0": self.commit,
+                "github.com/my/pack@{}".format(self.commit): self.commit
+            }
+        )
+        self.assertEqual(self.run_command.call_count, 2)
+        self.assertEqual((resolver.hits, resolver.misses), (0, 2))
+        resolver = RefResolver(self.path, self.run_command)
+        resolver.resolve("github.com/my/pack", "", "master")
+        resolver.resolve("github.com/my/pack", "", "v1.0")
+        self.assertEqual(self.run_command.call_count, 2)
+        self.assertEqual((resolver.hits, resolver.misses), (2, 0))
+
+    def test_count_once(self):
+        """test_count_once."""
+        self.run_command.return_value = ""
+        resolver = RefResolver(self.path, self.run_command)
+        for _ in range(3):
+            resolver.resolve("github.com/my/pack", "", "nobranch")
+        resolver.resolve_many(
+            [("github.com/my/pack", "", "nobranch")] * 2)
+        self.assertEqual(self.run_command.call_count, 4)
+        self.assertEqual((resolver.hits, resolver.misses), (0, 1))
+        self.run_command.return_value = "{}\trefs/heads/master\n".format(
+            self.commit)
+        for _ in range(3):
+            resolver.resolve("github.com/my/pack", "", "master")
+        self.assertEqual((resolver.hits, resolver.misses), (0, 2))
+
+    def test_resolve_expired(self):
+        """test_resolve_expired."""
+        resolver = RefResolver(self.path, self.run_command, ttl=0)
+        for _ in range(2):
+            resolver.resolve("github.com/my/pack", "", "master")
+            resolver.resolve("github.com/my/pack", "", "v1.0")
+        self.assertEqual(self.run_command.call_count, 3)
+
+
+class TestTimings(unittest.TestCase):
+    """Timings class Tests."""
+
+    def setUp(self):
+        """setUp."""
+        super(TestTimings, self).setUp()
+        self.path = "/tmp/outpak-trace.json"
+        self.timings = Timings()
+        start = self.timings.start
+        self.timings.add("clone", "pack-a", start, 2.0)
+        self.timings.add("install", "pack-a", start + 2, 0.5)
+        self.timings.add("clone", "pack-b", start + 1, 3.0)
+        self.timings.add("install", "pack-a", start + 3, 0.25)
+
+    def tearDown(self):
+        """tearDown."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_summary(self):
+        """test_summary."""
+        self.assertEqual(
+            self.timings.get_summary(),
+            [
+                ("clone", "pack-b", 3.0),
+                ("clone", "pack-a", 2.0),
+                ("install", "pack-a", 0.75)
+            ]
+        )
+        lines = self.timings.format_summary()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[1].startswith("clone     pack-b"))
+        self.assertTrue(lines[-1].startswith("total"))
+
+    def test_span(self):
+        """test_span."""
+        with self.assertRaises(ValueError):
+            with self.timings.span("parse", "requirements"):
+                raise ValueError()
+        self.assertEqual(self.timings.spans[-1].phase, "parse")
+
+    def test_save_trace(self):
+        """test_save_trace."""
+        self.timings.save_trace(self.path)
+        with open(self.path) as file:
+            events = json.load(file)['traceEvents']
+        self.assertEqual(
+            [(event['name'], event['ts'], event['dur'], event['ph'])
+             for event in events],
+            [
+                ("clone pack-a", 0, 2000000, "X"),
+                ("clone pack-b", 1000000, 3000000, "X"),
+                ("install pack-a", 2000000, 500000, "X"),
+                ("install pack-a", 3000000, 250000, "X")
+            ]
+        )
+
+
+class TestProfiling(unittest.TestCase):
+    """Profiling module Tests."""
+
+    def setUp(self):
+        """setUp."""
+        super(TestProfiling, self).setUp()
+        self.path = "/tmp/outpak.prof"
+
+    def tearDown(self):
+        """tearDown."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_run_with_profilers(self):
+        """test_run_with_profilers."""
+        import pstats
+        self.assertEqual(
+            run_with_profilers(
+                lambda: [str(i) for i in range(1000)],
+                profile_path=self.path,
+                trace_memory=True
+            )[-1],
+            "999"
+        )
+        self.assertTrue(pstats.Stats(self.path).total_calls > 0)
+
+    def test_run_with_profilers_threads(self):
+        """test_run_with_profilers_threads."""
+        import pstats
+        from concurrent.futures import ThreadPoolExecutor
+
+        def worker_function():
+            return sum(range(1000))
+
+        def function():
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                return [
+                    future.result()
+                    for future in [executor.submit(worker_function)
+                                   for _ in range(2)]
+                ]
+
+        run_with_profilers(function, profile_path=self.path)
+        stats = pstats.Stats(self.path)
+        self.assertIn(
+            "worker_function",
+            [name for _, _, name in stats.stats])
+
+    def test_run_with_profilers_exit(self):
+        """test_run_with_profilers_exit."""
+        with self.assertRaises(SystemExit):
+            run_with_profilers(
+                lambda: sys.exit(1), profile_path=self.path)
+        self.assertTrue(os.path.exists(self.path))
+
+
+class TestMetrics(unittest.TestCase):
+    """Metrics class Tests."""
+
+    def test_format_openmetrics(self):
+        """test_format_openmetrics."""
+        metrics = Metrics()
+        metrics.inc("outpak_cache_hits", cache="wheel")
+        metrics.inc("outpak_cache_hits", cache="wheel")
+        metrics.set("outpak_run_success", 1)
+        metrics.set(
+            "outpak_phase_seconds", 1.5, phase='clone "full"')
+        self.assertEqual(
+            metrics.format_openmetrics({'env': "dev"}).splitlines(),
+            [
+                "# HELP outpak_run_success 1 if last run succeeded, else 0",
+                "# TYPE outpak_run_success gauge",
+                'outpak_run_success{env="dev"} 1',
+                "# HELP outpak_cache_hits Cache hits in last run, by cache",
+                "# TYPE outpak_cache_hits gauge",
+                'outpak_cache_hits{env="dev",cache="wheel"} 2',
+                "# HELP outpak_phase_seconds Time spent in each phase",
+                "# TYPE outpak_phase_seconds gauge",
+                'outpak_phase_seconds{env="dev",phase="clone \\"full\\""}'
+                ' 1.5',
+                "# EOF"
+            ]
+        )
+        with self.assertRaises(ValueError):
+            metrics.inc("outpak_unknown")
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """HTTP handler without request logs, serving files from root."""
+
+    root = None
+
+    def translate_path(self, path):
+        """Return path inside root, instead of current directory."""
+        path = super(QuietHandler, self).translate_path(path)
+        return os.path.join(self.root, os.path.relpath(path, os.getcwd()))
+
+    def log_message(self, *args):
+        """Do not log requests."""
+
+
+class TestArchive(unittest.TestCase):
+    """Archive module Tests, using a local HTTP server."""
+
+    def setUp(self):
+        """setUp."""
+        super(TestArchive, self).setUp()
+        self.path = "/tmp/outpak-archive"
+        self.commit = "da39a3ee5e6b4b0d3255bfef95601890afd80709"
+        www = os.path.join(self.path, "www", "my_group", "my_pack")
+        os.makedirs(www)
+        self._make_tarball(
+            os.path.join(www, "{}.tar.gz".format(self.commit)),
+            {
+                "my_pack-da39a3e/setup.py": "",
+                "my_pack-da39a3e/my_pack/__init__.py": "VERSION = 1\n"
+            }
+        )
+        self.server = HTTPServer(
+            ("127.0.0.1", 0),
+            type("Handler", (QuietHandler,),
+                 {'root': os.path.join(self.path, "www")}))
+        threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={'poll_interval': 0.05},
+            daemon=True
+        ).start()
+        self.template = "http://127.0.0.1:{}/{{owner}}/{{repo}}/" \
+            "{{ref}}.tar.gz".format(self.server.server_port)
+
+    def tearDown(self):
+        """tearDown."""
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    def _make_tarball(self, path, files):
+        with tarfile.open(path, "w:gz") as archive:
+            for name, content in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content.encode("utf-8"))
+                archive.addfile(info, io.BytesIO(content.encode("utf-8")))
+
+    def test_get_archive_url(self):
+        """test_get_archive_url."""
+        self.assertEqual(
+            get_archive_url("github.com/my_group/my_pack", "v1.0"),
+            "https://api.github.com/repos/my_group/my_pack/tarball/v1.0"
+        )
+        self.assertEqual(
+            get_archive_url("bitbucket.org/my_group/my_pack", "v1.0"),
+            "https://bitbucket.org/my_group/my_pack/get/v1.0.tar.gz"
+        )
+        self.assertIsNone(
+            get_archive_url("git.myproject.org/MyProject", "v1.0"))
+        self.assertEqual(
+            get_archive_url(
+                "git.myproject.org/my_group/my_pack", "v1.0",
+                "https://{host}/archive/{path}@{ref}.tgz"),
+            "https://git.myproject.org/archive/my_group/my_pack@v1.0.tgz"
+        )
+
+    def test_download_and_extract(self):
+        """test_download_and_extract."""
+        archive_path = os.path.join(self.path, "source.tar.gz")
+        destination = os.path.join(self.path, "my_pack")
+        download(
+            get_archive_url(
+                "github.com/my_group/my_pack", self.commit, self.template),
+            archive_path,
+            headers={'Authorization': "token 1234"}
+        )
+        os.makedirs(destination)
+        extract(archive_path, destination)
+        self.assertEqual(
+            sorted(os.listdir(destination)), ["my_pack", "setup.py"])
+        with self.assertRaises(ArchiveError):
+            download(
+                get_archive_url(
+                    "github.com/my_group/my_pack", "master", self.template),
+                archive_path
+            )
+
+    def test_extract_unsafe_path(self):
+        """test_extract_unsafe_path."""
+        archive_path = os.path.join(self.path, "unsafe.tar.gz")
+        self._make_tarball(archive_path, {"my_pack/../../evil.py": ""})
+        with self.assertRaises(ArchiveError):
+            extract(archive_path, os.path.join(self.path, "my_pack"))
+
+    def test_fetch_package_with_archive(self):
+        """test_fetch_package_with_archive."""
+        instance = Outpak(
+            "/tmp/pak.yml", use_archive=True, archive_url=self.template)
+        instance.environment = {'clone_dir': os.path.join(self.path, "src")}
+        instance.git_token = "1234"
+        package = parse_line(
+            "git+https://github.com/my_group/my_pack@master#egg=my_pack")
+        with patch.object(
+                instance, "resolve_head", return_value=self.commit):
+            kind, path = instance.fetch_package(package)
+        self.assertEqual(kind, "path")
+        with open(os.path.join(path, COMMIT_FILE)) as file:
+            self.assertEqual(file.read(), self.commit)
+        self.assertEqual(instance._get_source_commit(path), self.commit)
+        self.assertEqual(
+            get_installed_commit(Distribution(
+                "my_pack", "1.0", [],
+                {"url": "file://" + path, "dir_info": {}})),
+            self.commit
+        )
+
+    def test_fetch_package_fallback(self):
+        """test_fetch_package_fallback."""
+        instance = Outpak(
+            "/tmp/pak.yml", use_archive=True, archive_url=self.template)
+        instance.environment = {'clone_dir': os.path.join(self.path, "src")}
+        package = parse_line(
+            "git+https://github.com/my_group/my_pack@master#egg=my_pack")
+        with patch.object(
+                instance, "resolve_head", return_value="0" * 40), \
+                patch.object(
+                    instance, "_clone_package", return_value="/tmp/src"):
+            self.assertEqual(
+                instance.fetch_package(package), ("path", "/tmp/src"))
+        self.assertEqual(
+            instance.metrics.get("outpak_retries", reason="archive"), 1)
+
 
 class TestOutpakClass(unittest.TestCase):
     """OutPak class Tests.
@@ -153,8 +787,13 @@ class TestOutpakClass(unittest.TestCase):
             del os.environ['TEST_BIT_TOKEN_PAK']
         if os.path.exists(self.path):
             os.remove(self.path)
-        if os.path.exists('/tmp/requirements.txt'):
-            os.remove('/tmp/requirements.txt')
+        for path in ['/tmp/requirements.txt', '/tmp/requirements_test.txt']:
+            if os.path.exists(path):
+                os.remove(path)
+        if os.path.exists('/tmp/pak.lock'):
+            os.remove('/tmp/pak.lock')
+        if os.path.exists(self.instance._get_stamp_path()):
+            os.remove(self.instance._get_stamp_path())
 
     def _load_from_file(self):
         with open(self.path, "w") as file:
@@ -172,7 +811,7 @@ class TestOutpakClass(unittest.TestCase):
     def test_command(self):
         """test_command."""
         ret = self.instance._run_command(
-            task="echo hello-world",
+            task=["echo", "hello-world"],
             get_stdout=True,
             verbose=True
         )
@@ -181,6 +820,27 @@ class TestOutpakClass(unittest.TestCase):
             u'hello-world\n'
         )
 
+    def test_command_failure_output(self):
+        """test_command_failure_output."""
+        output = []
+        self.assertFalse(self.instance._run_command(
+            ["outpak-command-not-found"], output=output))
+        self.assertEqual(len(output), 1)
+        self.assertIn("outpak-command-not-found", output[0][0])
+        for silent, get_stdout in [(True, False), (False, True)]:
+            output = []
+            self.assertFalse(self.instance._run_command(
+                [sys.executable, "-c",
+                 "import sys; sys.exit('fatal: not a git repository')"],
+                silent=silent, get_stdout=get_stdout, output=output))
+            self.assertEqual(
+                output, [("fatal: not a git repository", False)])
+        output = []
+        self.assertFalse(self.instance._run_command(
+            [sys.executable, "-c", "import sys; sys.exit('error')"],
+            output=output))
+        self.assertEqual(output, [("error", False)])
+
     def test_load_yaml(self):
         """test_load_yaml."""
         self._load_from_file()
@@ -283,7 +943,7 @@ class TestOutpakClass(unittest.TestCase):
         line = "django==2.0.0"
         data = self._parse_line(line)
         self.assertEqual(
-            data['name'],
+            data.name,
             'django'
         )
 
@@ -291,17 +951,17 @@ class TestOutpakClass(unittest.TestCase):
         """test_parse_line_latest_requirement."""
         line = "django"
         data = self._parse_line(line)
-        self.assertIsNone(data['version'])
+        self.assertIsNone(data.version)
 
     def test_parse_line_nonsecure_requirement(self):
         """test_parse_line_nonsecure_requirement."""
         line = "-e ./package/my_package"
         data = self._parse_line(line)
         self.assertEqual(
-            data['line'],
+            data.line,
             line.replace("-e", "").strip()
         )
-        self.assertTrue(data['using_line'])
+        self.assertTrue(data.using_line)
 
     def test_parse_line_git_https(self):
         """test_parse_line_git_https."""
@@ -312,7 +972,7 @@ class TestOutpakClass(unittest.TestCase):
         for line in line_list:
             data = self._parse_line(line)
             self.assertEqual(
-                data['url'],
+                data.url,
                 "github.com/chrismaille/outpak"
             )
 
@@ -325,7 +985,7 @@ class TestOutpakClass(unittest.TestCase):
         for line in line_list:
             data = self._parse_line(line)
             self.assertEqual(
-                data['url'],
+                data.url,
                 "github.com/chrismaille/outpak"
             )
 
@@ -347,9 +1007,8 @@ class TestOutpakClass(unittest.TestCase):
             os.path.join(self.instance.environment['clone_dir'], "outpak")
         )
 
-    @patch("outpak.main.subprocess.check_output",
-           autospec=True, return_value="cmd")
-    @patch("outpak.main.subprocess.call", autospec=True, return_value=0)
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
     def test_install_package_with_url(self, *args):
         """test_install_package_with_url."""
         line = "-e git+git@github.com:chrismaille/outpak@1.0.0#egg=outpak"
@@ -367,9 +1026,8 @@ class TestOutpakClass(unittest.TestCase):
             self.instance.install_package(package)
         )
 
-    @patch("outpak.main.subprocess.check_output",
-           autospec=True, return_value="cmd")
-    @patch("outpak.main.subprocess.call", autospec=True, return_value=0)
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
     def test_install_package_with_pip(self, *args):
         """test_install_package_with_pip."""
         line = "requests[security]>=2.18.0"
@@ -382,18 +1040,660 @@ class TestOutpakClass(unittest.TestCase):
             self.instance.install_package(package)
         )
 
-    @patch("outpak.main.subprocess.check_output",
-           autospec=True, return_value="cmd")
-    @patch("outpak.main.subprocess.call", autospec=True, return_value=0)
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
     def test_run(self, *args):
         """test_run."""
         with open(self.path, "w") as file:
             file.write(PAK)
         with open('/tmp/requirements.txt', "w") as file:
             file.write(REQ)
+        with open('/tmp/requirements_test.txt', "w") as file:
+            file.write("pytest\n")
         os.environ['TEST_ENV_PAK'] = 'development'
         os.environ['TEST_GIT_TOKEN_PAK'] = '12345abcdef'
         os.environ['TEST_BIT_TOKEN_PAK'] = "abcde:1234"
         self.assertIsNone(
             self.instance.run()
         )
+        self.assertEqual(
+            self.instance.requirement_files,
+            ['/tmp/requirements.txt', '/tmp/requirements_test.txt']
+        )
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
+    def test_run_with_timings(self, *args):
+        """test_run_with_timings."""
+        with open(self.path, "w") as file:
+            file.write(PAK)
+        with open('/tmp/requirements.txt', "w") as file:
+            file.write(REQ)
+        with open('/tmp/requirements_test.txt', "w") as file:
+            file.write("pytest\n")
+        os.environ['TEST_ENV_PAK'] = 'development'
+        os.environ['TEST_GIT_TOKEN_PAK'] = '12345abcdef'
+        os.environ['TEST_BIT_TOKEN_PAK'] = "abcde:1234"
+        trace_path = "/tmp/outpak-trace.json"
+        self.instance = Outpak(
+            self.path, force=True, timings=True, trace=trace_path)
+        self.instance.run()
+        phases = set(span.phase for span in self.instance.timings.spans)
+        self.assertTrue({"parse", "install"}.issubset(phases))
+        self.assertTrue(os.path.exists(trace_path))
+        os.remove(trace_path)
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
+    def test_command_hooks(self, *args):
+        """test_command_hooks."""
+        calls = []
+        self.instance.add_hook(
+            "before_command", lambda *args: calls.append(("before",) + args))
+        self.instance.add_hook(
+            "after_command", lambda *args: calls.append(("after",) + args))
+        self.instance._run_command(
+            ["pip", "install", "outpak"], span=("install", "outpak"))
+        self.assertEqual(
+            calls,
+            [
+                ("before", ["pip", "install", "outpak"], None,
+                 ("install", "outpak")),
+                ("after", ["pip", "install", "outpak"], None,
+                 ("install", "outpak"), CommandResult(0, 0.1, "", "cmd"))
+            ]
+        )
+        with self.assertRaises(ValueError):
+            self.instance.add_hook("after_install", print)
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
+    def test_run_with_metrics(self, *args):
+        """test_run_with_metrics."""
+        with open(self.path, "w") as file:
+            file.write(PAK)
+        with open('/tmp/requirements.txt', "w") as file:
+            file.write(REQ)
+        with open('/tmp/requirements_test.txt', "w") as file:
+            file.write("pytest\n")
+        os.environ['TEST_ENV_PAK'] = 'development'
+        os.environ['TEST_GIT_TOKEN_PAK'] = '12345abcdef'
+        os.environ['TEST_BIT_TOKEN_PAK'] = "abcde:1234"
+        metrics_path = "/tmp/outpak.prom"
+        json_path = "/tmp/outpak-metrics.json"
+        self.instance = Outpak(
+            self.path, force=True, metrics_file=metrics_path,
+            metrics_json=json_path)
+        self.instance.run()
+        with open(metrics_path) as file:
+            text = file.read()
+        os.remove(metrics_path)
+        self.assertIn('outpak_run_success{env="dev"} 1\n', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+        with open(json_path) as file:
+            data = json.load(file)
+        os.remove(json_path)
+        self.assertEqual(
+            data['outpak_packages'][0],
+            {
+                "labels": {"env": "dev", "state": "requested"},
+                "value": self.instance.metrics.get(
+                    "outpak_packages", state="requested")
+            }
+        )
+        self.assertEqual(
+            self.instance.metrics.get("outpak_packages", state="installed"),
+            self.instance.metrics.get("outpak_packages", state="requested")
+        )
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
+    def test_wheelhouse(self, mock_run):
+        """test_wheelhouse."""
+        os.environ['TEST_ENV_PAK'] = 'development'
+        self._load_from_file()
+        self.instance.get_current_environment()
+        del os.environ['TEST_ENV_PAK']
+        path = "/tmp/outpak-wheelhouse"
+        package_list = parse_lines([
+            "requests==2.18.0",
+            "git+https://github.com/my/pack@master#egg=pack",
+            "-e ./packages/my_package"
+        ])
+        wheel = "/tmp/core/.wheels/pack-1.0-py3-none-any.whl"
+        try:
+            with patch.object(
+                    self.instance, "fetch_package",
+                    return_value=("wheel", wheel)):
+                Wheelhouse(self.instance, path, jobs=2).run(package_list)
+        finally:
+            shutil.rmtree(path)
+        commands = [args[0][0] for args in mock_run.call_args_list]
+        self.assertEqual(
+            [command[:2] for command in commands],
+            [["pip", "wheel"], ["pip", "wheel"], ["pip", "install"],
+             ["pip", "install"], ["pip", "install"]]
+        )
+        for command in commands[:2]:
+            self.assertTrue(
+                command[3].startswith(os.path.join(path, ".worker-")))
+        self.assertEqual(
+            commands[2],
+            ["pip", "install", "--force-reinstall", "--no-deps",
+             "--no-index", "--find-links", path, wheel]
+        )
+        self.assertEqual(
+            commands[3][:5],
+            ["pip", "install", "--no-index", "--find-links", path]
+        )
+        self.assertEqual(commands[4][-1], "./packages/my_package")
+        self.assertEqual(
+            self.instance.metrics.get("outpak_packages", state="installed"),
+            3
+        )
+
+    def test_wheelhouse_same_name(self):
+        """test_wheelhouse_same_name."""
+        package_list = parse_lines([
+            "git+https://github.com/my/pack@master#egg=pack",
+            "git+https://github.com/other/pack@master#egg=pack",
+            "git+https://github.com/my/tool@master#egg=tool"
+        ])
+        active = []
+
+        def fetch_package(package, output):
+            active.append(package.name)
+            running = list(active)
+            time.sleep(0.05)
+            active.remove(package.name)
+            if running.count(package.name) > 1:
+                return None
+            return "wheel", "/tmp/{}.whl".format(package.url.split("/")[1])
+
+        with patch.object(
+                self.instance, "fetch_package", side_effect=fetch_package):
+            wheels = Wheelhouse(
+                self.instance, "/tmp", jobs=3).build_wheels(package_list)
+        self.assertEqual(
+            wheels, ["/tmp/my.whl", "/tmp/other.whl", "/tmp/my.whl"])
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
+    def test_bundle(self, mock_run):
+        """test_bundle."""
+        def prefetch(wheelhouse, package_list):
+            os.makedirs(wheelhouse.path)
+            for filename in ["pack-1.0-py3-none-any.whl",
+                             "requests-2.18.0-py3-none-any.whl"]:
+                with open(os.path.join(wheelhouse.path, filename), "w"):
+                    pass
+            return ["requests==2.18.0", "pack-1.0-py3-none-any.whl"]
+
+        with open(self.path, "w") as file:
+            file.write(PAK)
+        with open('/tmp/requirements.txt', "w") as file:
+            file.write("requests==2.18.0\n")
+        os.environ['TEST_ENV_PAK'] = 'development'
+        os.environ['TEST_GIT_TOKEN_PAK'] = '12345abcdef'
+        os.environ['TEST_BIT_TOKEN_PAK'] = "abcde:1234"
+        bundle_path = "/tmp/outpak-bundle.tar.gz"
+        try:
+            with patch("outpak.wheelhouse.Wheelhouse.prefetch",
+                       autospec=True, side_effect=prefetch):
+                self.instance.bundle(bundle_path)
+            instance = Outpak("/tmp/do-not-exist")
+            instance.install_bundle(bundle_path)
+        finally:
+            os.remove(bundle_path)
+        command = mock_run.call_args[0][0]
+        self.assertEqual(command[:3], ["pip", "install", "--no-index"])
+        self.assertEqual(instance.environment_name, "dev")
+        self.assertEqual(
+            instance.metrics.get("outpak_packages", state="installed"), 2)
+
+    def test_install_invalid_bundle(self):
+        """test_install_invalid_bundle."""
+        with self.assertRaises(SystemExit):
+            self.instance.install_bundle("/tmp/do-not-exist.tar.gz")
+
+    def test_get_requirement_line(self):
+        """test_get_requirement_line."""
+        line_list = [
+            ("requests[security]>=2.18.0", "requests[security]>=2.18.0"),
+            ("django == 2.0.1", "django==2.0.1"),
+            ("-e ./packages/my_package", "-e ./packages/my_package"),
+            (
+                "SomeProject ==5.4 ; python_version < '2.7'",
+                "SomeProject ==5.4 ; python_version < '2.7'"
+            ),
+            (
+                "six==1.0 --hash=sha256:abcd --hash sha256:ef01",
+                "six==1.0 --hash=sha256:abcd --hash=sha256:ef01"
+            )
+        ]
+        for line, expected in line_list:
+            package = self._parse_line(line)
+            self.assertEqual(
+                self.instance._get_requirement_line(package),
+                expected
+            )
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", None))
+    def test_install_batch(self, mock_call):
+        """test_install_batch."""
+        package_list = [
+            self._parse_line("requests[security]>=2.18.0"),
+            self._parse_line("django==2.0.1")
+        ]
+        self.instance.install_batch(package_list)
+        self.assertEqual(mock_call.call_count, 1)
+        self.assertEqual(
+            mock_call.call_args[0][0][:3], ["pip", "install", "-r"])
+
+    @patch("outpak.main.run_command", autospec=True, side_effect=[
+        CommandResult(1, 0.1, "", None),
+        CommandResult(0, 0.1, "", None),
+        CommandResult(0, 0.1, "", None)
+    ])
+    def test_install_batch_fallback(self, mock_call):
+        """test_install_batch_fallback."""
+        package_list = [
+            self._parse_line("requests[security]>=2.18.0"),
+            self._parse_line("django==2.0.1")
+        ]
+        self.instance.install_batch(package_list)
+        self.assertEqual(mock_call.call_count, 3)
+
+    def _get_pipeline_packages(self):
+        return [
+            self._parse_line(
+                "-e git+git@github.com:chrismaille/outpak@1.0.0#egg=outpak"),
+            self._parse_line("django==2.0.1"),
+            self._parse_line(
+                "git+https://github.com/chrismaille/buzio#egg=buzio"),
+            self._parse_line("requests")
+        ]
+
+    def test_pipeline(self):
+        """test_pipeline."""
+        package_list = self._get_pipeline_packages()
+        installed = []
+        with patch.object(
+                self.instance, "fetch_package",
+                side_effect=lambda package, output: ("path", "/tmp")), \
+                patch.object(
+                    self.instance, "build_package",
+                    side_effect=lambda package, source, output: source), \
+                patch.object(
+                    self.instance, "install_package",
+                    side_effect=lambda package, source:
+                    installed.append((package.name, source))):
+            Pipeline(self.instance, fetch_jobs=2).run(package_list)
+        self.assertEqual(
+            installed,
+            [
+                ("outpak", ("path", "/tmp")),
+                ("django", None),
+                ("buzio", ("path", "/tmp")),
+                ("requests", None)
+            ]
+        )
+
+    def test_pipeline_batch(self):
+        """test_pipeline_batch."""
+        package_list = self._get_pipeline_packages()
+        installed = []
+        with patch.object(
+                self.instance, "fetch_package",
+                side_effect=lambda package, output: ("wheel", "/tmp")), \
+                patch.object(
+                    self.instance, "install_batch",
+                    side_effect=lambda package_list:
+                    installed.append(
+                        [package.name for package in package_list])), \
+                patch.object(
+                    self.instance, "install_package",
+                    side_effect=lambda package, source:
+                    installed.append(package.name)):
+            Pipeline(self.instance).run(package_list, batch=True)
+        self.assertEqual(
+            installed,
+            [["django", "requests"], "outpak", "buzio"]
+        )
+
+    def test_pipeline_failure(self):
+        """test_pipeline_failure."""
+        package_list = self._get_pipeline_packages()
+        with patch.object(
+                self.instance, "fetch_package", return_value=None), \
+                patch.object(
+                    self.instance, "install_package") as mock_install:
+            with self.assertRaises(SystemExit):
+                Pipeline(self.instance, fetch_jobs=2).run(package_list)
+        mock_install.assert_not_called()
+
+    def test_pipeline_later_failure(self):
+        """test_pipeline_later_failure."""
+        package_list = self._get_pipeline_packages()
+
+        def fetch_package(package, output):
+            if package.name == "buzio":
+                return None
+            time.sleep(0.2)
+            return "path", "/tmp"
+
+        with patch.object(
+                self.instance, "fetch_package",
+                side_effect=fetch_package), \
+                patch.object(
+                    self.instance, "build_package",
+                    side_effect=lambda package, source, output: source), \
+                patch.object(
+                    self.instance, "install_package") as mock_install:
+            with self.assertRaises(SystemExit):
+                Pipeline(self.instance, fetch_jobs=2).run(package_list)
+        mock_install.assert_not_called()
+
+    def test_wrong_jobs(self):
+        """test_wrong_jobs."""
+        self._load_from_file()
+        os.environ['TEST_ENV_PAK'] = 'development'
+        self.instance.get_current_environment()
+        del os.environ['TEST_ENV_PAK']
+        self.instance.options['jobs'] = "zero"
+        with self.assertRaises(SystemExit):
+            self.instance._get_jobs()
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", None))
+    def test_clone_package_shallow(self, mock_call):
+        """test_clone_package_shallow."""
+        package = self._parse_line(
+            "-e git+https://github.com/chrismaille/outpak@1.0.0#egg=outpak")
+        self.instance.git_token = "1234"
+        self.instance._clone_package(package)
+        self.assertEqual(
+            [call[0][0] for call in mock_call.call_args_list],
+            [
+                ["git", "init", "-q"],
+                [
+                    "git", "remote", "add", "origin",
+                    "https://1234@github.com/chrismaille/outpak"
+                ],
+                [
+                    "git", "fetch", "--depth", "1", "--filter=blob:none",
+                    "origin", "1.0.0"
+                ],
+                ["git", "checkout", "-q", "FETCH_HEAD"]
+            ]
+        )
+
+    @patch("outpak.main.run_command", autospec=True, side_effect=[
+        CommandResult(0, 0.1, "", None),
+        CommandResult(0, 0.1, "", None),
+        CommandResult(128, 0.1, "", None),
+        CommandResult(0, 0.1, "", None),
+        CommandResult(0, 0.1, "", None)
+    ])
+    def test_clone_package_full(self, mock_call):
+        """test_clone_package_full."""
+        package = self._parse_line(
+            "-e git+https://github.com/chrismaille/outpak@3ecdf45#egg=outpak")
+        self.assertEqual(
+            self.instance._clone_package(package),
+            os.path.join(
+                self.instance.environment['clone_dir'], "outpak", "outpak")
+        )
+        self.assertEqual(mock_call.call_count, 5)
+        self.assertEqual(
+            mock_call.call_args_list[3][0][0][:2], ["git", "clone"])
+        self.assertEqual(
+            mock_call.call_args_list[4][0][0], ["git", "checkout", "3ecdf45"])
+
+    def _create_git_repo(self, path):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        git = "git -c user.name=outpak -c user.email=outpak@test"
+        subprocess.check_call(
+            "cd {0} && git init -q && {1} commit -q --allow-empty -m first "
+            "&& git tag v1.0 && {1} commit -q --allow-empty -m second".format(
+                path, git),
+            shell=True)
+        return "file://{}".format(path)
+
+    def test_clone_package_from_mirror(self):
+        """test_clone_package_from_mirror."""
+        package = self._parse_line(
+            "-e git+https://github.com/chrismaille/outpak@v1.0#egg=outpak")
+        remote = self._create_git_repo("/tmp/outpak-remote")
+        self.instance.environment['clone_dir'] = "/tmp/outpak-clone"
+        self.instance.options['use_mirror'] = True
+        with patch.object(
+                self.instance, "_get_remote_url", return_value=remote):
+            for _ in range(2):
+                full_package_path = self.instance._clone_package(package)
+        self.assertEqual(
+            full_package_path,
+            "/tmp/outpak-clone/outpak/outpak"
+        )
+        self.assertTrue(os.path.exists(
+            "/tmp/outpak-clone/.mirrors/github.com/chrismaille/outpak.git"))
+        self.assertEqual(
+            subprocess.check_output(
+                "cd {} && git log -1 --format=%s".format(full_package_path),
+                shell=True).strip(),
+            b"first"
+        )
+        shutil.rmtree("/tmp/outpak-remote")
+        shutil.rmtree("/tmp/outpak-clone")
+
+    def test_resolve_head(self):
+        """test_resolve_head."""
+        remote = self._create_git_repo("/tmp/outpak-remote")
+        tag_commit = subprocess.check_output(
+            "cd /tmp/outpak-remote && git rev-parse v1.0",
+            shell=True).decode('utf-8').strip()
+        with patch.object(
+                self.instance, "_get_remote_url", return_value=remote):
+            package = self._parse_line(
+                "git+https://github.com/chrismaille/outpak@v1.0#egg=outpak")
+            self.instance.environment['clone_dir'] = "/tmp/outpak-clone"
+            self.assertEqual(self.instance.resolve_head(package), tag_commit)
+            package = self._parse_line(
+                "git+https://github.com/chrismaille/outpak@{}"
+                "#egg=outpak".format(tag_commit))
+            self.assertEqual(self.instance.resolve_head(package), tag_commit)
+            package = self._parse_line(
+                "git+https://github.com/chrismaille/outpak@nobranch"
+                "#egg=outpak")
+            self.assertIsNone(self.instance.resolve_head(package))
+        self.assertTrue(os.path.exists("/tmp/outpak-clone/.refs.json"))
+        shutil.rmtree("/tmp/outpak-remote")
+        shutil.rmtree("/tmp/outpak-clone")
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", ""))
+    def test_install_with_cached_wheel(self, mock_call):
+        """test_install_with_cached_wheel."""
+        commit = "da39a3ee5e6b4b0d3255bfef95601890afd80709"
+        package = self._parse_line(
+            "git+https://github.com/chrismaille/outpak@{}"
+            "#egg=outpak".format(commit))
+        self.instance.environment['clone_dir'] = "/tmp/outpak-clone"
+        self.instance.options['use_wheel_cache'] = True
+        wheel_dir = self.instance._get_wheel_dir(package, commit)
+        os.makedirs(wheel_dir)
+        wheel = os.path.join(wheel_dir, "outpak-1.0.1-py2.py3-none-any.whl")
+        open(wheel, "w").close()
+        self.assertEqual(self.instance.get_cached_wheel(package), wheel)
+        package = package.replace(head=commit[:7])
+        self.assertEqual(self.instance.get_cached_wheel(package), wheel)
+        self.instance.install_package(package)
+        self.assertEqual(
+            [args[0][0] for args in mock_call.call_args_list[-2:]],
+            [
+                ["pip", "install", "--force-reinstall", "--no-deps", wheel],
+                ["pip", "install", wheel]
+            ]
+        )
+        shutil.rmtree("/tmp/outpak-clone")
+
+    def test_is_installed(self):
+        """test_is_installed."""
+        snapshot = {
+            "requests": Distribution(
+                name="requests",
+                version="2.18.4",
+                requires=[
+                    "idna<2.7,>=2.5",
+                    "pyOpenSSL>=0.14; extra == 'security'"
+                ],
+                direct_url=None
+            ),
+            "pyopenssl": Distribution(
+                name="pyOpenSSL",
+                version="17.5.0",
+                requires=[],
+                direct_url=None
+            ),
+            "outpak": Distribution(
+                name="outpak",
+                version="1.0.1",
+                requires=[],
+                direct_url={
+                    "url": "https://github.com/chrismaille/outpak",
+                    "vcs_info": {
+                        "vcs": "git",
+                        "commit_id": "3ecdf45a6b4b0d3255bfef95601890afd807091"
+                    }
+                }
+            )
+        }
+        line_list = [
+            ("requests", True),
+            ("Requests==2.18.4", True),
+            ("requests>=2.19", False),
+            ("requests[security]>=2.18.0", True),
+            ("requests[socks]", True),
+            ("django", False),
+            ("requests; sys_platform == 'win32'", False),
+            (
+                "git+https://github.com/chrismaille/outpak@3ecdf45"
+                "#egg=outpak",
+                True
+            ),
+            (
+                "git+https://github.com/chrismaille/outpak@1234567"
+                "#egg=outpak",
+                False
+            ),
+            (
+                "git+https://github.com/chrismaille/outpak@3ecd"
+                "#egg=outpak",
+                False
+            ),
+        ]
+        with patch.object(self.instance, "resolve_head", return_value=None):
+            for line, expected in line_list:
+                package = self._parse_line(line)
+                self.assertEqual(
+                    self.instance.is_installed(package, snapshot),
+                    expected,
+                    line
+                )
+        package = self._parse_line(
+            "git+https://github.com/chrismaille/outpak@3ecd#egg=outpak")
+        with patch.object(
+                self.instance, "resolve_head",
+                return_value="3ecdf45a6b4b0d3255bfef95601890afd807091"):
+            self.assertTrue(self.instance.is_installed(package, snapshot))
+        del snapshot["pyopenssl"]
+        package = self._parse_line("requests[security]")
+        self.assertFalse(self.instance.is_installed(package, snapshot))
+
+    @patch("outpak.main.run_command", autospec=True,
+           return_value=CommandResult(0, 0.1, "", "cmd"))
+    def test_run_unchanged(self, mock_call):
+        """test_run_unchanged."""
+        with open(self.path, "w") as file:
+            file.write(PAK)
+        with open('/tmp/requirements.txt', "w") as file:
+            file.write("django==2.0.1\n")
+        os.environ['TEST_ENV_PAK'] = 'development'
+        os.environ['TEST_GIT_TOKEN_PAK'] = '12345abcdef'
+        os.environ['TEST_BIT_TOKEN_PAK'] = "abcde:1234"
+        self.instance.run()
+        self.assertEqual(mock_call.call_count, 1)
+        self.assertIsNotNone(self.instance.read_stamp())
+        self.instance.run()
+        self.assertEqual(mock_call.call_count, 1)
+        self.instance.options['force'] = True
+        self.instance.run()
+        self.assertEqual(mock_call.call_count, 2)
+        with open('/tmp/requirements.txt', "w") as file:
+            file.write("django==2.0.2\n")
+        self.instance.options['force'] = None
+        self.instance.run()
+        self.assertEqual(mock_call.call_count, 3)
+
+    def test_lock(self):
+        """test_lock."""
+        commit = "da39a3ee5e6b4b0d3255bfef95601890afd80709"
+        with open(self.path, "w") as file:
+            file.write(PAK)
+        with open('/tmp/requirements.txt', "w") as file:
+            file.write(
+                "django>=2.0\n"
+                "requests[security]\n"
+                "-e git+https://github.com/chrismaille/outpak@master"
+                "#egg=outpak\n"
+                "six==1.16.0 --hash=sha256:abcd\n")
+        os.environ['TEST_ENV_PAK'] = 'development'
+        os.environ['TEST_GIT_TOKEN_PAK'] = '12345abcdef'
+        os.environ['TEST_BIT_TOKEN_PAK'] = "abcde:1234"
+        with patch.object(
+                self.instance, "resolve_heads",
+                return_value={
+                    "github.com/chrismaille/outpak@master": commit}), \
+                patch.object(
+                    self.instance, "_resolve_versions",
+                    return_value={"django": "2.0.1", "requests": "2.18.4",
+                                  "six": "1.16.0"}):
+            self.instance.lock()
+        lock = self.instance.read_lock()
+        self.assertEqual(
+            lock['heads'],
+            {"github.com/chrismaille/outpak@master": commit}
+        )
+        package_list = self.instance.apply_lock(
+            self.instance.read_packages(['/tmp/requirements.txt']))
+        self.assertEqual(
+            [
+                self.instance._get_requirement_line(package)
+                for package in package_list[:2]
+            ],
+            ["django==2.0.1", "requests[security]==2.18.4"]
+        )
+        self.assertEqual(package_list[2].head, commit)
+        self.assertEqual(
+            self.instance._get_requirement_line(package_list[3]),
+            "six==1.16.0 --hash=sha256:abcd")
+
+    def test_apply_outdated_lock(self):
+        """test_apply_outdated_lock."""
+        self._load_from_file()
+        os.environ['TEST_ENV_PAK'] = 'development'
+        self.instance.get_current_environment()
+        del os.environ['TEST_ENV_PAK']
+        with open('/tmp/pak.lock', "w") as file:
+            file.write(
+                "version: '1'\n"
+                "envs:\n"
+                "  dev:\n"
+                "    packages:\n"
+                "      django: 1.11.0\n")
+        package_list = self.instance.apply_lock(
+            [self.instance.parse_line("django>=2.0")])
+        self.assertEqual(package_list[0].version, "2.0")
@@ -0,0 +1,127 @@
+"""Timings module."""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+
+Span = namedtuple(
+    "Span",
+    ["phase", "name", "start", "duration", "thread"]
+)
+
+
+class Timings():
+    """Record how long each phase takes for each package.
+
+    Phases are: parse, resolve, download, clone, checkout, build
+    and install. Spans can be added from many threads.
+
+    Attributes
+    ----------
+        spans (list): recorded spans
+        start (float): time when recording started
+
+    """
+
+    def __init__(self):
+        """Initialize class."""
+        self.spans = []
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, phase, name, start, duration):
+        """Add span.
+
+        Args:
+            phase (string): phase name (ex.: "clone")
+            name (string): package name
+            start (float): start time, in seconds since epoch
+            duration (float): duration in seconds
+        """
+        with self._lock:
+            self.spans.append(
+                Span(phase, name, start, duration, threading.get_ident()))
+
+    @contextmanager
+    def span(self, phase, name):
+        """Record span for code inside ``with`` block.
+
+        Args:
+            phase (string): phase name (ex.: "parse")
+            name (string): package name
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(phase, name, start, time.time() - start)
+
+    def get_summary(self):
+        """Return total duration for each phase and package.
+
+        Returns
+        -------
+            List: tuples with phase, name and duration, slowest first
+
+        """
+        totals = OrderedDict()
+        for span in self.spans:
+            key = (span.phase, span.name)
+            totals[key] = totals.get(key, 0) + span.duration
+        return sorted(
+            [(phase, name, duration)
+             for (phase, name), duration in totals.items()],
+            key=lambda row: row[2],
+            reverse=True
+        )
+
+    def format_summary(self):
+        """Return summary as a text table.
+
+        Returns
+        -------
+            List: table lines
+
+        """
+        rows = self.get_summary()
+        width = max([len(name) for _, name, _ in rows] + [7])
+        lines = ["{:<10}{:<{width}}  {:>9}".format(
+            "Phase", "Package", "Seconds", width=width)]
+        for phase, name, duration in rows:
+            lines.append("{:<10}{:<{width}}  {:>9.3f}".format(
+                phase, name, duration, width=width))
+        lines.append("{:<10}{:<{width}}  {:>9.3f}".format(
+            "total", "", time.time() - self.start, width=width))
+        return lines
+
+    def save_trace(self, path):
+        """Save spans as a Chrome trace event file.
+
+        The file can be opened in ``chrome://tracing`` or Perfetto.
+
+        Args:
+            path (string): full path for trace file
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": "{} {}".format(span.phase, span.name),
+                "cat": span.phase,
+                "ph": "X",
+                "ts": int((span.start - self.start) * 1000000),
+                "dur": int(span.duration * 1000000),
+                "pid": pid,
+                "tid": span.thread,
+                "args": {"package": span.name}
+            }
+            for span in sorted(self.spans, key=lambda span: span.start)
+        ]
+        with open(path, "w") as file:
+            json.dump(
+                {"traceEvents": events, "displayTimeUnit": "ms"},
+                file,
+                indent=1
+            )
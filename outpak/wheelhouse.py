@@ -0,0 +1,316 @@
+"""Wheelhouse module."""
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from buzio import console
+
+
+class Wheelhouse():
+    """Prefetch packages as wheels and install them offline.
+
+    Git packages, local paths and urls are built as wheels
+    first. Then pip packages and the dependencies for all packages
+    are downloaded (and built, if only a source distribution is
+    found) by concurrent ``pip wheel`` workers. All packages are
+    installed with ``--no-index``, using only the wheels in the
+    wheelhouse folder.
+
+    Git wheels are reinstalled from the ``.wheels`` cache, so
+    the installed commit can be found in their path.
+
+    Attributes
+    ----------
+        git_wheels (list): full path for wheels built for git
+            packages by last prefetch
+        jobs (int): number of parallel workers
+        outpak (Outpak): Outpak instance
+        path (string): full path for wheelhouse folder
+
+    """
+
+    def __init__(self, outpak, path, jobs=1):
+        """Initialize class.
+
+        Args:
+            outpak (Outpak): Outpak instance
+            path (string): full path for wheelhouse folder
+            jobs (int, optional): number of parallel workers
+        """
+        self.outpak = outpak
+        self.path = path
+        self.jobs = jobs
+        self.git_wheels = []
+
+    def _is_direct(self, package):
+        """Check if package must be built before download.
+
+        Editable packages, local paths and urls cannot be found in
+        wheelhouse by name, so they are built as wheels first.
+        """
+        return bool(
+            self.outpak._use_token(package) or
+            package.option == "-e" or
+            not self.outpak._get_requirement(package)
+        )
+
+    def _build_wheel(self, package):
+        """Build wheel for package which cannot be found by name.
+
+        Git packages are fetched with Outpak (using tokens) and other
+        packages are built with ``pip wheel``. Editable packages are
+        built as regular wheels.
+
+        Returns
+        -------
+            Tuple: wheel path (or None if failed) and buffered output
+
+        """
+        output = []
+        if not self.outpak._use_token(package):
+            return self._build_with_pip(package, output), output
+        source = self.outpak.fetch_package(package, output)
+        if source and source[0] == "path":
+            wheel = self.outpak._build_wheel(package, source[1], output)
+            if not wheel:
+                self.outpak.metrics.inc("outpak_failures", phase="build")
+            source = ("wheel", wheel) if wheel else None
+        return source[1] if source else None, output
+
+    def _build_with_pip(self, package, output):
+        build_dir = tempfile.mkdtemp(prefix=".build-", dir=self.path)
+        try:
+            if not self.outpak._run_command(
+                    ["pip", "wheel", "--no-deps", "-w", build_dir,
+                     self.outpak._get_requirement_line(
+                         package.replace(option=None, hashes=""))],
+                    verbose=True,
+                    output=output,
+                    span=("build", package.name)):
+                self.outpak.metrics.inc("outpak_failures", phase="build")
+                return None
+            wheels = os.listdir(build_dir)
+            if not wheels:
+                return None
+            wheel = os.path.join(self.path, wheels[0])
+            os.replace(os.path.join(build_dir, wheels[0]), wheel)
+            return wheel
+        finally:
+            shutil.rmtree(build_dir)
+
+    def _build_group(self, package_list):
+        """Build wheels for packages, one after another."""
+        return [self._build_wheel(package) for package in package_list]
+
+    def build_wheels(self, package_list):
+        """Build wheels for packages, in parallel.
+
+        Args:
+            package_list (list): packages parsed from requirements.txt
+
+        Returns
+        -------
+            List: full path for each wheel, in package order
+
+        """
+        if not package_list:
+            return []
+        # Git packages with same name share the clone dir, so
+        # they are built one after another, by the same worker.
+        groups = OrderedDict()
+        for index, package in enumerate(package_list):
+            key = package.name if self.outpak._use_token(package) else index
+            groups.setdefault(key, []).append(index)
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            group_results = executor.map(
+                self._build_group,
+                [[package_list[index] for index in indexes]
+                 for indexes in groups.values()])
+            results = [None] * len(package_list)
+            for indexes, group_result in zip(groups.values(), group_results):
+                for index, result in zip(indexes, group_result):
+                    results[index] = result
+        wheels = []
+        for package, (wheel, output) in zip(package_list, results):
+            self.outpak._flush_output(output)
+            if not wheel:
+                console.error(
+                    "Cannot build wheel for {}. Task aborted.".format(
+                        package.name))
+                sys.exit(1)
+            wheels.append(wheel)
+        return wheels
+
+    def _download(self, index, lines):
+        """Run one ``pip wheel`` worker in its own folder.
+
+        Workers do not write in the same folder, so two workers
+        never save the same file at the same time.
+
+        Returns
+        -------
+            Tuple: worker folder (or None if failed) and buffered output
+
+        """
+        output = []
+        worker_dir = tempfile.mkdtemp(prefix=".worker-", dir=self.path)
+        with tempfile.NamedTemporaryFile(
+                mode="w", prefix="outpak-", suffix=".txt",
+                delete=False) as reqfile:
+            reqfile.write("".join("{}\n".format(line) for line in lines))
+        try:
+            ret = self.outpak._run_command(
+                ["pip", "wheel", "-w", worker_dir, "--find-links",
+                 self.path] + self.outpak._get_constraints() +
+                ["-r", reqfile.name],
+                verbose=True,
+                output=output,
+                span=("download", "worker-{}".format(index))
+            )
+        finally:
+            os.remove(reqfile.name)
+        if not ret:
+            shutil.rmtree(worker_dir)
+            return None, output
+        return worker_dir, output
+
+    def download(self, lines):
+        """Download wheels for requirement lines, in parallel.
+
+        Lines are split between workers. Each worker saves the
+        wheels for its lines and their dependencies, which are
+        moved to wheelhouse when all workers finish.
+
+        Args:
+            lines (list): requirement lines or wheel paths
+
+        Returns
+        -------
+            Bool: all workers succeeded
+
+        """
+        if not lines:
+            return True
+        groups = [
+            lines[index::self.jobs]
+            for index in range(min(self.jobs, len(lines)))
+        ]
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            results = list(executor.map(
+                self._download, range(len(groups)), groups))
+        success = True
+        for worker_dir, output in results:
+            self.outpak._flush_output(output)
+            if not worker_dir:
+                success = False
+                continue
+            for filename in os.listdir(worker_dir):
+                os.replace(
+                    os.path.join(worker_dir, filename),
+                    os.path.join(self.path, filename))
+            shutil.rmtree(worker_dir)
+        return success
+
+    def prefetch(self, package_list):
+        """Save wheels for all packages in wheelhouse.
+
+        Args:
+            package_list (list): Data parsed from requirements.txt
+
+        Returns
+        -------
+            List: requirement lines to install from wheelhouse, with
+                git packages, paths and urls as wheel file names
+
+        """
+        direct_packages = [
+            package for package in package_list if self._is_direct(package)
+        ]
+        pip_lines = [
+            self.outpak._get_requirement_line(package)
+            for package in package_list
+            if not self._is_direct(package)
+        ]
+        console.section("Prefetching {} packages into {}".format(
+            len(package_list), self.path))
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        wheels = self.build_wheels(direct_packages)
+        self.git_wheels = [
+            wheel
+            for package, wheel in zip(direct_packages, wheels)
+            if self.outpak._use_token(package)
+        ]
+        if not self.download(pip_lines + wheels):
+            self.outpak.metrics.inc("outpak_failures", phase="download")
+            console.error("Cannot download packages. Task aborted.")
+            sys.exit(1)
+        return pip_lines + [os.path.basename(wheel) for wheel in wheels]
+
+    def install(self, lines, reinstall=None):
+        """Install requirement lines using only wheelhouse.
+
+        A new commit usually keeps the same version, and pip skips
+        wheels for versions already installed, so git wheels are
+        reinstalled first, without dependencies.
+
+        Args:
+            lines (list): lines returned by prefetch
+            reinstall (list, optional): wheels to reinstall
+
+        Returns
+        -------
+            Bool: install succeeded
+
+        """
+        options = ["--no-index", "--find-links", self.path] + \
+            self.outpak._get_constraints()
+        task_list = []
+        if reinstall:
+            task_list.append(
+                ["pip", "install", "--force-reinstall", "--no-deps"] +
+                options + reinstall)
+        with tempfile.NamedTemporaryFile(
+                mode="w", prefix="outpak-", suffix=".txt",
+                delete=False) as reqfile:
+            reqfile.write("".join("{}\n".format(line) for line in lines))
+        task_list.append(["pip", "install"] + options + ["-r", reqfile.name])
+        try:
+            return self.outpak._run_commands(
+                task_list,
+                cwd=self.path,
+                verbose=True,
+                span=("install", "wheelhouse")
+            )
+        finally:
+            os.remove(reqfile.name)
+
+    def run(self, package_list):
+        """Prefetch and install packages.
+
+        Editable packages are installed from source after the
+        offline install, so they stay linked to their source.
+
+        Args:
+            package_list (list): Data parsed from requirements.txt
+        """
+        offline = [
+            package for package in package_list if package.option != "-e"
+        ]
+        if offline:
+            lines = self.prefetch(offline)
+            console.section(
+                "Installing {} packages from wheelhouse".format(
+                    len(offline)))
+            if not self.install(lines, self.git_wheels):
+                self.outpak.metrics.inc("outpak_failures", phase="install")
+                console.error("Cannot install packages from wheelhouse.")
+                sys.exit(1)
+            self.outpak.metrics.inc(
+                "outpak_packages", len(offline), state="installed")
+        for package in package_list:
+            if package.option == "-e":
+                self.outpak.install_package(package)
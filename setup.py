@@ -15,6 +15,8 @@ with copen(path.join(here, 'README.rst'), encoding='utf-8') as f:
 install_requires = [
     "buzio",
     "docopt",
+    "importlib_metadata; python_version < '3.8'",
+    "packaging",
     "PyYAML"
 ]
 
@@ -39,12 +41,12 @@ setup(
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
         'Topic :: Software Development :: User Interfaces',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6'
     ],
     keywords='pip install git personal token',
     packages=find_packages(exclude=['contrib', 'docs', 'tests']),
+    python_requires='>=3.5',
     install_requires=install_requires,
     entry_points={
         'console_scripts': [